@@ -1,39 +1,46 @@
 import os
-from supabase import create_client, Client
+import threading
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 
 class Database:
     def __init__(self):
-        self.client: Client = None
-        if SUPABASE_URL and SUPABASE_KEY:
-            try:
-                self.client = create_client(SUPABASE_URL, SUPABASE_KEY)
-            except Exception as e:
-                print(f"Failed to initialize Supabase: {e}")
+        # The supabase package and its client are only loaded on first use,
+        # which keeps them off the cold-start path of requests that never
+        # touch the database.
+        self.configured = bool(SUPABASE_URL and SUPABASE_KEY)
+        self._client = None
+        self._lock = threading.Lock()
 
-    def get_next_invoice_number(self, invoice_type: str, year: int) -> int:
-        if not self.client:
-            # Fallback or error
-            return 0
-        
-        # Example: Query a 'sequences' table or 'invoices' count
-        # For simplicity, we count existing invoices of this type/year
-        # Real impl should use a sequence or atomic increment
-        res = self.client.table("invoices").select("invoice_no", count="exact").eq("invoice_type", invoice_type).eq("year", year).execute()
-        count = res.count
-        return count + 1
+    @property
+    def client(self):
+        if self._client is None and self.configured:
+            with self._lock:
+                if self._client is None:
+                    try:
+                        from supabase import create_client
+                        self._client = create_client(SUPABASE_URL, SUPABASE_KEY)
+                    except Exception as e:
+                        print(f"Failed to initialize Supabase: {e}")
+                        raise
+        return self._client
 
-    def save_invoice(self, data: dict):
-        if not self.client:
-            return
-        
-        # Transform data to match DB schema if needed
-        # Assuming table 'invoices' exists
-        try:
-            self.client.table("invoices").insert(data).execute()
-        except Exception as e:
-            print(f"DB Insert Error: {e}")
+    def reserve_invoice_numbers(self, invoice_type: str, year: int, count: int = 1) -> int:
+        # Atomic upsert on invoice_sequences, see api/sql/001_invoice_sequences.sql.
+        # Returns the last number of the reserved block.
+        res = self.client.rpc("reserve_invoice_numbers", {"p_type": invoice_type, "p_year": year, "p_count": count}).execute()
+        return int(res.data)
+
+    def raise_invoice_sequence(self, invoice_type: str, year: int, last_no: int) -> int:
+        # Never lowers a counter, see api/sql/003_raise_invoice_sequence.sql.
+        res = self.client.rpc("raise_invoice_sequence", {"p_type": invoice_type, "p_year": year, "p_last_no": last_no}).execute()
+        return int(res.data)
+
+    def upsert_invoices(self, rows: list):
+        # Idempotent on (invoice_type, year, invoice_no), see api/sql/002_invoices_unique_key.sql.
+        # Errors propagate so the outbox (or the legacy import) can retry the batch.
+        # returning="minimal": nobody reads the rows back, so don't ship them.
+        self.client.table("invoices").upsert(rows, on_conflict="invoice_type,year,invoice_no", returning="minimal").execute()
 
 db = Database()
@@ -0,0 +1,291 @@
+"""Import a legacy invoices.csv (and its invoice_log.csv counters) into Supabase.
+
+    python -m api.import_legacy path/to/invoices.csv --log path/to/invoice_log.csv
+    python -m api.import_legacy path/to/invoices.csv --dry-run
+
+The CSV is read one record at a time and never held in memory. Rows are
+validated, de-duplicated on (invoice_type, year, invoice_no) within each
+chunk (the later row wins, as it does across chunks through the upsert) and
+upserted in chunks of --chunk-size while the next chunk is parsed. Rows
+that fail validation are written to <csv>.rejected.csv with the reason.
+
+Rows are keyed the way the API keys its own invoices. The desktop app
+logged cash and leasing sales alike as SALES; they become SALES-LEASING
+when a balance is left to finance and SALES-CASH otherwise, as the API
+would have recorded them. ``year`` is the year the number was issued in,
+which is what the counters are kept by. invoices.csv has no column for it,
+so, as in ``InvoiceStore.import_csv``, it is taken from the invoice date
+unless the CSV has a ``year`` column.
+
+After every chunk the byte offset reached is saved to <csv>.import.json, so
+an interrupted import picks up where it stopped when run again, and a
+later run only imports rows appended since. Delivery is at least once: the
+chunk in flight when an import stops is upserted again on resume, which
+the upsert makes harmless. --restart ignores the
+checkpoint. At the end each invoice_sequences counter is raised to the
+highest number seen in the CSV or the log (it is never lowered), so the API
+does not hand out numbers the desktop app already used.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from invoice_core.records import counter_for, format_number
+from invoice_core.sequence import FileSequenceAllocator
+from invoice_core.store import FIELDS
+
+INVOICE_TYPES = ("SALES", "SALES-CASH", "SALES-LEASING", "PROFORMA", "ADVANCE")
+AMOUNTS = ("price", "down", "balance")
+# The columns the API writes for an invoice (see invoice_data in api/main.py).
+DB_FIELDS = [f for f in FIELDS if f != "payment_method"]
+REJECT_COLUMNS = ["line", "reason", "invoice_type", "invoice_no", "date"]
+
+
+def validate(rec, default_type):
+    """The Supabase row for one CSV record; raises ValueError with the reason it is unusable."""
+    it = (rec.get("invoice_type") or default_type or "").strip().upper()
+    if it not in INVOICE_TYPES:
+        raise ValueError(f"unknown invoice_type {it!r}")
+    no = (rec.get("invoice_no") or "").strip()
+    if not no.isdigit():
+        raise ValueError(f"invoice_no {no!r} is not a number")
+    date = (rec.get("date") or "").strip()
+    try:
+        year = datetime.strptime(date, "%Y-%m-%d").year
+    except ValueError:
+        raise ValueError(f"date {date!r} is not YYYY-MM-DD")
+    issued = (rec.get("year") or "").strip()
+    if issued:
+        if not (issued.isdigit() and len(issued) == 4):
+            raise ValueError(f"year {issued!r} is not a year")
+        year = int(issued)
+    row = {"invoice_type": it, "year": year}
+    for f in DB_FIELDS:
+        v = rec.get(f)
+        row[f] = "" if v is None else str(v).strip()
+    for f in AMOUNTS:
+        try:
+            row[f] = float(row[f].replace(",", "")) if row[f] else 0.0
+        except ValueError:
+            raise ValueError(f"{f} {row[f]!r} is not a number")
+    row["invoice_no"] = format_number(int(no))
+    row["date"] = date
+    if it == "SALES":
+        row["invoice_type"] = "SALES-LEASING" if row["balance"] > 0 else "SALES-CASH"
+    row["is_leasing"] = row["invoice_type"] == "SALES-LEASING"
+    return row
+
+
+def records(path, offset, line):
+    """(record, end offset, line) for every CSV record after byte ``offset``."""
+    with open(path, "rb") as fh:
+        header = next(csv.reader([fh.readline().decode("utf-8-sig")]), None)
+        if not header:
+            return
+        start = fh.tell()
+        if offset < start:
+            offset, line = start, 1
+        fh.seek(offset)
+        position = [offset]
+
+        def lines():
+            for raw in fh:
+                if not raw.endswith(b"\n"):
+                    # A row still being written by the app; the next run takes it.
+                    return
+                position[0] += len(raw)
+                yield raw.decode("utf-8", "replace")
+
+        reader = csv.reader(lines())
+        for values in reader:
+            if not values:
+                continue
+            rec = dict(zip(header, values))
+            yield rec, position[0], line + reader.line_num
+
+
+def file_header(path):
+    with open(path, "rb") as fh:
+        return next(csv.reader([fh.readline().decode("utf-8-sig")]), [])
+
+
+def load_checkpoint(path, header):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    if state.get("header") != header:
+        raise SystemExit(f"{path} was written for a CSV with different columns; pass --restart to import from the top")
+    return state
+
+
+def save_checkpoint(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def upsert_with_retry(upsert, rows, retries):
+    if not rows:
+        return
+    for attempt in range(retries):
+        try:
+            upsert(rows)
+            return
+        except Exception as e:
+            if attempt == retries - 1:
+                raise
+            delay = min(2 ** attempt, 30)
+            print(f"Upsert of {len(rows)} rows failed ({e}); retrying in {delay}s")
+            time.sleep(delay)
+
+
+def run(args, upsert, raise_sequence):
+    source = os.path.abspath(args.csv)
+    if not os.path.exists(source):
+        raise SystemExit(f"{source} not found")
+    checkpoint = source + ".import.json"
+    header = file_header(source)
+    missing = [c for c in ("invoice_no", "date") if c not in header]
+    if missing:
+        raise SystemExit(f"{source} has no {', '.join(missing)} column")
+
+    state = None if args.restart or args.dry_run else load_checkpoint(checkpoint, header)
+    if state:
+        print(f"Resuming at line {state['line']} ({state['offset'] / 1e6:.1f} MB in)")
+    else:
+        state = {"header": header, "offset": 0, "line": 1, "counters": {},
+                 "stats": {"read": 0, "rejected": 0, "duplicates": 0, "upserted": 0}}
+
+    rejected_path = source + ".rejected.csv"
+    with open(rejected_path, "a" if state["offset"] and os.path.exists(rejected_path) else "w",
+              newline="", encoding="utf-8") as rejected_file:
+        rejects = csv.writer(rejected_file)
+        if rejected_file.tell() == 0:
+            rejects.writerow(REJECT_COLUMNS)
+        session = import_chunks(args, source, state, upsert, rejects, rejected_file, checkpoint)
+
+    # Counters: the highest number used in the CSV or handed out by invoice_log.csv.
+    counters = state["counters"]
+    if args.log and os.path.exists(args.log):
+        for (inv_type, year), n in FileSequenceAllocator(args.log).last_numbers().items():
+            k = f"{counter_for(inv_type)}|{year}"
+            counters[k] = max(counters.get(k, 0), n)
+    print("\nCounter          Year   Last no")
+    for k in sorted(counters):
+        inv_type, year = k.split("|")
+        last = raise_sequence(inv_type, int(year), counters[k])
+        print(f"{inv_type:<16} {year:>4} {last:>9}")
+
+    elapsed = session["elapsed"] or 1e-9
+    stats = state["stats"]
+    print(f"\n{session['read']:,} rows read in {elapsed:.1f}s "
+          f"({session['read'] / elapsed:,.0f} rows/s, {session['bytes'] / 1e6 / elapsed:.1f} MB/s)")
+    print(f"{session['upserted']:,} {'valid' if args.dry_run else 'upserted'}, "
+          f"{session['rejected']:,} rejected (see {rejected_path}), {session['duplicates']:,} duplicates merged")
+    if session["read"] != stats["read"]:
+        print(f"Since the first run: {stats['read']:,} read, {stats['upserted']:,} upserted, "
+              f"{stats['rejected']:,} rejected, {stats['duplicates']:,} duplicates merged")
+
+
+def import_chunks(args, source, state, upsert, rejects, rejected_file, checkpoint):
+    """Validate, dedupe and upsert every record after the checkpoint; one chunk uploads while the next is parsed."""
+    started = time.perf_counter()
+    first_offset = state["offset"]
+    session = dict.fromkeys(("read", "rejected", "duplicates", "upserted"), 0)
+    pending = None
+
+    def commit(job):
+        # Wait for the chunk in flight, then move the checkpoint past it. Its
+        # rejects and counts are recorded only now, so a resumed run never
+        # repeats them.
+        future, rows, tally, rejected, offset, line = job
+        future.result()
+        rejects.writerows(rejected)
+        tally["upserted"] = len(rows)
+        for k, n in tally.items():
+            state["stats"][k] += n
+            session[k] += n
+        counters = state["counters"]
+        for r in rows:
+            k = f"{counter_for(r['invoice_type'])}|{r['year']}"
+            counters[k] = max(counters.get(k, 0), int(r["invoice_no"]))
+        state["offset"], state["line"] = offset, line
+        if not args.dry_run:
+            rejected_file.flush()
+            save_checkpoint(checkpoint, state)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        chunk, rejected = {}, []
+        tally = dict.fromkeys(("read", "rejected", "duplicates"), 0)
+        offset, line = state["offset"], state["line"]
+        last_report = started
+        try:
+            for rec, offset, line in records(source, state["offset"], state["line"]):
+                tally["read"] += 1
+                try:
+                    row = validate(rec, args.default_type)
+                except ValueError as e:
+                    tally["rejected"] += 1
+                    rejected.append([line, str(e), rec.get("invoice_type", ""), rec.get("invoice_no", ""), rec.get("date", "")])
+                    row = None
+                if row:
+                    key = (row["invoice_type"], row["year"], row["invoice_no"])
+                    if key in chunk:
+                        tally["duplicates"] += 1
+                        del chunk[key]
+                    chunk[key] = row
+                if len(chunk) >= args.chunk_size or len(rejected) >= args.chunk_size:
+                    rows = list(chunk.values())
+                    future = pool.submit(upsert_with_retry, upsert, rows, args.retries)
+                    if pending:
+                        commit(pending)
+                    pending = (future, rows, tally, rejected, offset, line)
+                    chunk, rejected = {}, []
+                    tally = dict.fromkeys(("read", "rejected", "duplicates"), 0)
+                    now = time.perf_counter()
+                    if now - last_report >= args.progress:
+                        last_report = now
+                        print(f"line {line:,}: {(session['read'] + tally['read']) / (now - started):,.0f} rows/s, "
+                              f"{session['upserted']:,} upserted")
+            if pending:
+                commit(pending)
+            if tally["read"]:
+                rows = list(chunk.values())
+                commit((pool.submit(upsert_with_retry, upsert, rows, args.retries), rows, tally, rejected, offset, line))
+        except Exception as e:
+            raise SystemExit(f"Import stopped after line {state['line']} ({e}); run the same command again to resume")
+    session["elapsed"] = time.perf_counter() - started
+    session["bytes"] = state["offset"] - first_offset
+    return session
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a legacy invoices.csv into Supabase.")
+    parser.add_argument("csv", help="invoices.csv written by invoice_app.py or web_app.py")
+    parser.add_argument("--log", help="invoice_log.csv whose counters should be carried over")
+    parser.add_argument("--default-type", default="SALES", help="type of rows without an invoice_type column")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows per upsert")
+    parser.add_argument("--retries", type=int, default=5, help="attempts per chunk before stopping")
+    parser.add_argument("--progress", type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and import from the top")
+    parser.add_argument("--dry-run", action="store_true", help="validate and count only; nothing is written to Supabase")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        run(args, lambda rows: None, lambda inv_type, year, last_no: last_no)
+        return
+    from .db import db
+    if not db.configured:
+        raise SystemExit("Set SUPABASE_URL and SUPABASE_KEY")
+    run(args, db.upsert_invoices, db.raise_invoice_sequence)
+
+
+if __name__ == "__main__":
+    main()
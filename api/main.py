@@ -1,16 +1,52 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+import time
+# Cold-start clock: /warmup and the first-PDF log line report time since here.
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
 from datetime import datetime
-import io, os, csv, sys
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+import asyncio, io, os, csv, multiprocessing, sys, zipfile
 from .db import db
+from invoice_core import admission, export, metrics, printrun, profiling, statement
+from invoice_core.analytics import InvoiceSnapshot
+from invoice_core.idempotency import IdempotencyStore, KeyInProgress, KeyReused, fingerprint
+from invoice_core.outbox import Outbox, recent_csv_keys
+from invoice_core.pdfcache import PdfCache, digest
+from invoice_core.records import append_csv, counter_for, format_number, safe_float
+from invoice_core.renderer import Renderer, render_job, warm_job
+from invoice_core.sequence import FileSequenceAllocator, LeasedSequenceAllocator
+from invoice_core.store import InvoiceStore
+
+@asynccontextmanager
+async def lifespan(app):
+    await run_in_threadpool(store.import_csv_if_empty, INVOICES_CSV)
+    # Replay anything left in the outbox by a previous run.
+    outbox.start()
+    yield
+    outbox.stop()
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
-styles = getSampleStyleSheet()
-small = ParagraphStyle("small", parent=styles["Normal"], fontSize=9, leading=11)
+STAGE_SECONDS = metrics.Histogram(
+    "invoice_stage_seconds", "Time spent in each stage of creating an invoice.", ["stage", "invoice_type"])
+REQUEST_SECONDS = metrics.Histogram(
+    "invoice_request_seconds", "Time to create an invoice, from request to PDF.", ["invoice_type", "status"])
+STAGE_FAILURES = metrics.Counter(
+    "invoice_stage_failures_total", "Invoice creations that failed, by the stage that raised.", ["stage", "invoice_type"])
+SINK_SECONDS = metrics.Histogram(
+    "invoice_sink_seconds", "Time to write one outbox batch to a sink (db is the Supabase insert).", ["sink"])
+SINK_FAILURES = metrics.Counter(
+    "invoice_sink_failures_total", "Outbox batches a sink failed to write and will retry.", ["sink"])
+REJECTED = metrics.Counter(
+    "invoice_rejected_total", "Invoice requests refused with 429: over the client's rate or the render queue full.", ["reason", "priority"])
+CACHE_FAILURES = metrics.Counter(
+    "invoice_pdf_cache_failures_total", "PDF cache writes that failed; the invoice is rendered again when next needed.", ["invoice_type"])
+FALLBACKS = metrics.Counter(
+    "invoice_fallbacks_total", "Work done the slow way: thread rendering, re-rendered reprints, offline invoices synced.", ["kind"])
 
 def app_dir():
     if getattr(sys, "frozen", False):
@@ -19,155 +55,699 @@ def app_dir():
 
 INVOICE_LOG = os.path.join(app_dir(), "invoice_log.csv")
 INVOICES_CSV = os.path.join(app_dir(), "invoices.csv")
+INVOICES_DB = os.path.join(app_dir(), "invoices.db")
+ANALYTICS_DIR = os.path.join(app_dir(), "invoice_analytics")
+PDF_CACHE_DIR = os.path.join(app_dir(), "pdf_cache")
+PDF_CACHE_MB = int(os.environ.get("INVOICE_PDF_CACHE_MB", "512"))
+IDEMPOTENCY_DB = os.path.join(app_dir(), "idempotency.db")
+IDEMPOTENCY_TTL = int(os.environ.get("INVOICE_IDEMPOTENCY_TTL", str(24 * 3600)))
+NUMBER_LEASE = int(os.environ.get("INVOICE_NUMBER_LEASE", "1"))
+ASSETS_DIR = os.path.dirname(app_dir())
+# Profiling: INVOICE_PROFILING=1 honours the X-Profile request header,
+# INVOICE_PROFILE_SAMPLE profiles that fraction of all invoices.
+PROFILING = os.environ.get("INVOICE_PROFILING", "") == "1"
+PROFILE_SAMPLE = float(os.environ.get("INVOICE_PROFILE_SAMPLE", "0"))
+PROFILE_MODE = os.environ.get("INVOICE_PROFILE_MODE", "cprofile")
+profiles = profiling.ProfileStore(os.path.join(app_dir(), "profiles"),
+                                  keep=int(os.environ.get("INVOICE_PROFILE_KEEP", "200")))
+
+renderer = Renderer(os.path.join(ASSETS_DIR, "download.png"), os.path.join(ASSETS_DIR, "singer_logo.png"))
+
+if db.configured:
+    sequence = LeasedSequenceAllocator(db.reserve_invoice_numbers, NUMBER_LEASE)
+else:
+    sequence = FileSequenceAllocator(INVOICE_LOG)
+
+_csv_written = None
 
-def init_csv():
-    if not os.path.exists(INVOICE_LOG):
-        with open(INVOICE_LOG, "w", newline="", encoding="utf-8") as f:
-            csv.writer(f).writerow(["invoice_type", "year", "last_no"])
+def append_invoice_rows(records):
+    # Outbox sink: skips rows already written before a crash lost the checkpoint.
+    global _csv_written
+    if _csv_written is None:
+        _csv_written = recent_csv_keys(INVOICES_CSV, ["invoice_type", "invoice_no", "date"])
+    rows = []
+    for r in records:
+        key = (r["invoice_type"], r["data"]["invoice_no"], r["data"]["date"])
+        if key not in _csv_written:
+            rows.append((r["invoice_type"], r["data"]))
+            _csv_written.add(key)
+    append_csv(INVOICES_CSV, rows, fsync=True)
+
+store = InvoiceStore(INVOICES_DB)
+snapshot = InvoiceSnapshot(ANALYTICS_DIR)
+pdf_cache = PdfCache(PDF_CACHE_DIR, PDF_CACHE_MB * 1024 * 1024)
+idempotency = IdempotencyStore(IDEMPOTENCY_DB, ttl=IDEMPOTENCY_TTL)
+
+def index_invoice_rows(records):
+    store.add_many((r["invoice_type"], r["year"], r["data"]) for r in records)
+    snapshot.refresh(store)
+
+def save_invoice_rows(records):
+    rows = []
+    for r in records:
+        db_data = r["data"].copy()
+        db_data["invoice_type"] = r["invoice_type"]
+        db_data["year"] = r["year"]
+        rows.append(db_data)
+    db.upsert_invoices(rows)
+
+def instrumented_sink(name, sink):
+    def write(records):
+        started = time.perf_counter()
+        try:
+            sink(records)
+        except Exception as e:
+            SINK_FAILURES.inc(sink=name)
+            metrics.log_event("sink_failed", sink=name, records=len(records), error=str(e))
+            raise
+        finally:
+            SINK_SECONDS.observe(time.perf_counter() - started, sink=name)
+    return write
+
+sinks = {"csv": append_invoice_rows, "store": index_invoice_rows}
+if db.configured:
+    sinks["db"] = save_invoice_rows
+sinks = {name: instrumented_sink(name, sink) for name, sink in sinks.items()}
+outbox = Outbox(os.path.join(app_dir(), "invoice_outbox.jsonl"), sinks)
 
 def write_invoice_csv(invoice_type, data):
-    # Try saving to DB first
-    if db.client:
-        # Enrich data for DB if necessary
-        db_data = data.copy()
-        db_data["invoice_type"] = invoice_type
-        db_data["year"] = datetime.now().year
-        db.save_invoice(db_data)
-
-    exists = os.path.exists(INVOICES_CSV)
-    with open(INVOICES_CSV, "a", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        if not exists:
-            w.writerow([
-                "invoice_type","invoice_no","date","customer","nic","cust_addr",
-                "delivery","model","engine","chassis","color","price","down",
-                "balance","finance_company","finance_address","dealer"
-            ])
-        w.writerow([
-            invoice_type,data["invoice_no"],data["date"],data["customer"],data["nic"],
-            data["cust_addr"],data["delivery"],data["model"],data["engine"],
-            data["chassis"],data["color"],data["price"],data["down"],
-            data["balance"],data.get("finance_company",""),data.get("finance_address",""),data.get("dealer","")
-        ])
+    outbox.append(invoice_type, datetime.now().year, data)
 
 def next_invoice_number(inv_type):
+    return format_number(sequence.next_number(counter_for(inv_type), datetime.now().year))
+
+# Types the API numbers and renders; anything else is refused before it
+# reaches the rate limiter or becomes a metric label.
+INVOICE_TYPES = ("SALES-CASH", "SALES-LEASING", "PROFORMA")
+
+def checked_invoice_type(invoice_type):
+    it = invoice_type.upper()
+    if it not in INVOICE_TYPES:
+        raise HTTPException(status_code=400, detail=f"invoice_type must be one of {', '.join(INVOICE_TYPES)}")
+    return it
+
+def invoice_data(it, inv_no, payload):
+    price = safe_float(payload.get("price", 0))
+    down = safe_float(payload.get("down", 0))
+    is_leasing = it == "SALES-LEASING"
+    balance = 0.0 if it == "SALES-CASH" else max(price - down, 0.0)
+    return {
+        "invoice_no": inv_no,
+        "date": payload.get("date") or datetime.now().strftime("%Y-%m-%d"),
+        "customer": payload.get("customer", ""),
+        "cust_addr": payload.get("cust_addr", ""),
+        "delivery": payload.get("delivery", ""),
+        "nic": payload.get("nic", ""),
+        "price": price,
+        "down": down,
+        "balance": balance,
+        "is_leasing": is_leasing,
+        "model": payload.get("model", ""),
+        "engine": payload.get("engine", ""),
+        "chassis": payload.get("chassis", ""),
+        "color": payload.get("color", ""),
+        "finance_company": payload.get("finance_company", ""),
+        "finance_address": payload.get("finance_address", ""),
+        "dealer": payload.get("dealer", ""),
+    }
+
+def cache_pdf(it, year, data, pdf):
+    try:
+        pdf_cache.put(it, year, data, pdf)
+    except Exception as e:
+        CACHE_FAILURES.inc(invoice_type=it)
+        metrics.log_event("pdf_cache_failed", invoice_type=it, invoice_no=data["invoice_no"], error=str(e))
+
+async def render_and_cache(it, year, data, profile=None):
+    # Workers only render; the cache index is written here, by the API process.
+    job_profile = (profiles, *profile) if profile else None
+    pdf = await run_render(render_job, renderer, it, data, job_profile)
+    await run_in_threadpool(cache_pdf, it, year, data, pdf)
+    return pdf
+
+def invoice_filename(data):
+    return f"{data['invoice_no']}_{data['customer'].replace(' ', '_')}.pdf"
+
+BATCH_LIMIT = int(os.environ.get("INVOICE_BATCH_LIMIT", "1000"))
+RENDER_WORKERS = int(os.environ.get("INVOICE_RENDER_WORKERS", "0")) or os.cpu_count()
+RENDER_CONCURRENCY = int(os.environ.get("INVOICE_RENDER_CONCURRENCY", "0")) or RENDER_WORKERS * 2
+_render_pool = None
+# Requests allowed between number allocation and a finished PDF; the rest
+# wait here, interactive before batch, instead of piling up allocated numbers
+# in the executor queue. Past INVOICE_QUEUE_LIMIT waiting, new ones get a 429.
+QUEUE_LIMIT = int(os.environ.get("INVOICE_QUEUE_LIMIT", "0")) or RENDER_CONCURRENCY * 4
+render_queue = admission.RenderQueue(RENDER_CONCURRENCY, QUEUE_LIMIT)
+# Per client (configured X-API-Key, else address), shared by the worker
+# processes on this host through SQLite; INVOICE_RATE_LIMIT=0 turns it off.
+rate_limiter = admission.RateLimiter(float(os.environ.get("INVOICE_RATE_LIMIT", "5")),
+                                     int(os.environ.get("INVOICE_RATE_BURST", "20")),
+                                     path=os.path.join(app_dir(), "rate_limits.db"))
+BATCH_KEYS = {k.strip() for k in os.environ.get("INVOICE_BATCH_KEYS", "").split(",") if k.strip()}
+API_KEYS = {k.strip() for k in os.environ.get("INVOICE_API_KEYS", "").split(",") if k.strip()} | BATCH_KEYS
+# Proxies in front of the API (1 behind Vercel); each appends the address it
+# was reached from to X-Forwarded-For. Without any, the header is ignored.
+TRUSTED_PROXIES = int(os.environ.get("INVOICE_TRUSTED_PROXIES", "0"))
+
+def authenticated_key(request):
+    """The request's X-API-Key if it is one of API_KEYS, None without one; any other key gets 401."""
+    key = request.headers.get("x-api-key")
+    if key is None:
+        return None
+    if key not in API_KEYS:
+        raise HTTPException(status_code=401, detail="Unknown API key")
+    return key
+
+def client_address(request):
+    peer = request.client.host if request.client else ""
+    if TRUSTED_PROXIES:
+        # Entries left of the ones our proxies added are whatever the client sent.
+        hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        if len(hops) >= TRUSTED_PROXIES:
+            return hops[-TRUSTED_PROXIES]
+    return peer
+
+def client_id(request, client_key):
+    if client_key:
+        return "key:" + client_key
+    return "ip:" + client_address(request)
+
+def request_priority(client_key):
+    # Single invoices are interactive unless they come with a key listed in INVOICE_BATCH_KEYS.
+    return admission.BATCH if client_key in BATCH_KEYS else admission.INTERACTIVE
+
+def too_many_requests(e, reason, priority):
+    priority = "batch" if priority == admission.BATCH else "interactive"
+    REJECTED.inc(reason=reason, priority=priority)
+    metrics.log_event("invoice_rejected", reason=reason, priority=priority, retry_after=e.header())
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.header()})
+
+_first_pdf_served = False
+
+def log_first_pdf():
+    global _first_pdf_served
+    if not _first_pdf_served:
+        _first_pdf_served = True
+        metrics.log_event("cold_start", first_pdf_ms=round((time.perf_counter() - IMPORT_STARTED) * 1000, 1))
+
+def render_pool():
+    global _render_pool
+    if _render_pool is None:
+        try:
+            # Workers start from a fresh interpreter, not a fork of this
+            # process with its threads, locks and open sqlite connections.
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _render_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                               mp_context=multiprocessing.get_context(method))
+        except (OSError, NotImplementedError):
+            # No POSIX semaphores (e.g. AWS Lambda behind Vercel): use threads.
+            _render_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS)
+            FALLBACKS.inc(kind="render_threads")
+    return _render_pool
+
+def replace_render_pool(broken):
+    # A worker that died (killed, out of memory, failed to start) breaks the
+    # whole pool for good; the next render_pool() call builds a new one.
+    global _render_pool
+    if _render_pool is broken:
+        _render_pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+        metrics.log_event("render_pool_replaced")
+
+async def run_render(fn, *args):
+    """``fn(*args)`` on the render pool, retried once on a new pool if the current one is broken."""
+    loop = asyncio.get_running_loop()
+    pool = render_pool()
+    try:
+        return await loop.run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        replace_render_pool(pool)
+    pool = render_pool()
+    try:
+        return await loop.run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        replace_render_pool(pool)
+        raise HTTPException(status_code=503, detail="Render workers are unavailable; try again shortly",
+                            headers={"Retry-After": "5"})
+
+async def read_batch(request, default_type):
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None:
+            raise ValueError("multipart batch needs a 'file' field with the CSV")
+        text = (await upload.read()).decode("utf-8-sig")
+        records = list(csv.DictReader(io.StringIO(text), restval=""))
+    else:
+        records = await request.json()
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ValueError("batch must be a JSON array of invoice objects or a CSV upload")
+    if not records:
+        raise ValueError("batch is empty")
+    if len(records) > BATCH_LIMIT:
+        raise ValueError(f"batch is limited to {BATCH_LIMIT} invoices")
+    batch = []
+    for r in records:
+        it = (r.get("invoice_type") or default_type).upper()
+        if it not in INVOICE_TYPES:
+            raise ValueError(f"unsupported invoice type {it!r}")
+        batch.append((it, r))
+    return batch
+
+class _ZipStream(io.RawIOBase):
+    # Unseekable sink: zipfile writes data descriptors and we hand out
+    # whatever has been written since the last drain.
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def zip_invoices(rendered):
+    stream = _ZipStream()
+    manifest = io.StringIO()
+    w = csv.writer(manifest)
+    w.writerow(["invoice_type", "invoice_no", "customer", "file"])
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as zf:
+        for it, data, pdf in rendered:
+            name = f"{it}/{invoice_filename(data)}"
+            zf.writestr(name, pdf)
+            w.writerow([it, data["invoice_no"], data["customer"], name])
+            yield stream.drain()
+        zf.writestr("manifest.csv", manifest.getvalue())
+    yield stream.drain()
+
+async def render_batch_job(it, data):
+    # Waits behind every interactive request; already admitted, so never refused.
+    async with render_queue.slot(admission.BATCH, bounded=False):
+        return await run_render(render_job, renderer, it, data)
+
+@app.post("/invoices/batch")
+async def create_invoice_batch(request: Request, invoice_type: str = "SALES-CASH"):
+    default_type = checked_invoice_type(invoice_type)
+    client_key = authenticated_key(request)
+    try:
+        batch = await read_batch(request, default_type)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        # One token per invoice, the same as creating them one by one.
+        await run_in_threadpool(rate_limiter.take, client_id(request, client_key), len(batch))
+    except admission.Rejected as e:
+        raise too_many_requests(e, "rate", admission.BATCH)
+    try:
+        render_queue.check(admission.BATCH)
+    except admission.Rejected as e:
+        raise too_many_requests(e, "queue", admission.BATCH)
+
+    # One contiguous block of numbers per counter.
     year = datetime.now().year
-    
-    if db.client:
-        count = db.get_next_invoice_number(inv_type, year)
-        # If DB returns 1 but we might have legacy CSV data?
-        # For now, trust DB if connected
-        if count > 1:
-             return f"{count:04d}"
-
-    init_csv()
-    rows = []
-    with open(INVOICE_LOG, "r", encoding="utf-8") as f:
-        rows = list(csv.reader(f))
-    last = 0
-    for r in rows:
-        if r and r[0] == inv_type and r[1] == str(year):
-            last = int(r[2])
-            break
-    new_no = last + 1
-    updated = False
-    for i, r in enumerate(rows):
-        if r and r[0] == inv_type and r[1] == str(year):
-            rows[i][2] = str(new_no)
-            updated = True
-    if not updated:
-        rows.append([inv_type, str(year), str(new_no)])
-    with open(INVOICE_LOG, "w", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerows(rows)
-    return f"{new_no:04d}"
-
-def safe_float(v):
+    counters = {}
+    for it, _ in batch:
+        typ = counter_for(it)
+        counters[typ] = counters.get(typ, 0) + 1
+    next_no = {}
+    for typ, count in counters.items():
+        next_no[typ] = await run_in_threadpool(sequence.allocate, typ, year, count)
+
+    invoices = []
+    for it, payload in batch:
+        typ = counter_for(it)
+        invoices.append((it, invoice_data(it, format_number(next_no[typ]), payload)))
+        next_no[typ] += 1
+
+    # Every PDF is rendered before anything is journaled or sent: a failed
+    # render fails the whole call, with none of the batch recorded (its
+    # numbers are skipped), instead of a ZIP cut short after a 200.
+    jobs = [asyncio.ensure_future(render_batch_job(it, data)) for it, data in invoices]
     try:
-        return float(v)
-    except:
-        return 0.0
-
-def build_sales_pdf(data):
-    buf = io.BytesIO()
-    doc = SimpleDocTemplate(buf, pagesize=A4, topMargin=45, bottomMargin=35, leftMargin=40, rightMargin=40)
-    elements = []
-    elements.append(Paragraph("<b><font size=\"15\">SALES INVOICE</font></b>", styles["Title"]))
-    elements.append(Spacer(1, 10))
-    header = [["", "", "Date:", data["date"]], ["", "", "Invoice No:", data["invoice_no"]], ["Customer Name:", data["customer"], "", ""], ["Address:", data["cust_addr"], "", ""], ["NIC:", data["nic"], "", ""]]
-    t = Table(header, colWidths=[95, 250, 70, 90])
-    t.setStyle(TableStyle([["FONTNAME", (0,0), (-1,-1), "Helvetica-Bold"]]))
-    elements += [t, Spacer(1, 15)]
-    label_price = "Total Price"
-    label_down = "Down Payment"
-    pay = [[label_price, f"Rs. {data['price']:,.2f}"], [label_down, f"Rs. {data['down']:,.2f}"]]
-    if data["balance"] > 0:
-        bal_label = "Leasing Amount" if data.get("is_leasing") else "Balance"
-        pay.append([bal_label, f"Rs. {data['balance']:,.2f}"])
-    pt = Table(pay, colWidths=[200, 200])
-    pt.setStyle(TableStyle([["GRID", (0,0), (-1,-1), 0.25, colors.black], ["FONTNAME", (0,0), (-1,-1), "Helvetica-Bold"]]))
-    elements += [Paragraph("<b>Payment Summary</b>", styles["Heading4"]), Spacer(1, 8), pt]
-    doc.build(elements)
-    buf.seek(0)
-    return buf
-
-def build_proforma_pdf(data):
-    buf = io.BytesIO()
-    doc = SimpleDocTemplate(buf, pagesize=A4, topMargin=45, bottomMargin=35, leftMargin=40, rightMargin=40)
-    elements = []
-    elements.append(Paragraph("<b><font size=\"15\">PROFORMA INVOICE</font></b>", styles["Title"]))
-    elements.append(Spacer(1, 10))
-    header_top = [["", "", "Date:", data["date"]], ["", "", "Invoice No:", data["invoice_no"]]]
-    ht = Table(header_top, colWidths=[95, 250, 70, 90])
-    ht.setStyle(TableStyle([["FONTNAME", (0,0), (-1,-1), "Helvetica-Bold"]]))
-    elements += [ht, Spacer(1, 12)]
-    header = [["Customer:", data["customer"], "NIC:", data["nic"]], ["Address:", data["cust_addr"], "", ""]]
-    t = Table(header, colWidths=[95, 250, 70, 90])
-    t.setStyle(TableStyle([["FONTNAME", (0,0), (-1,-1), "Helvetica-Bold"]]))
-    elements += [t, Spacer(1, 15)]
-    desc_table = Table([["DESCRIPTION", "", "SELLING PRICE", f"{data['price']:,.2f}"], ["MAKE", "PIAGGIO", "LEASE AMOUNT", f"{data['down']:,.2f}"], ["MODEL", data["model"], "", ""], ["COLOUR", data["color"], "", ""], ["ENGINE NO", data["engine"], "", ""], ["CHASSIS NO", data["chassis"], "", ""]], colWidths=[150, 200, 100, 95])
-    desc_table.setStyle(TableStyle([["BOX", (0,0), (-1,-1), 1, colors.black], ["INNERGRID", (0,0), (-1,-1), 0.5, colors.black], ["FONTSIZE", (0,0), (-1,-1), 9], ["VALIGN", (0,0), (-1,-1), "TOP"]]))
-    elements += [desc_table]
-    doc.build(elements)
-    buf.seek(0)
-    return buf
+        pdfs = await asyncio.gather(*jobs)
+    except Exception as e:
+        for job in jobs:
+            job.cancel()
+        failed = next(data for job, (_, data) in zip(jobs, invoices)
+                      if job.done() and not job.cancelled() and job.exception() is not None)
+        metrics.log_event("batch_failed", invoices=len(invoices), invoice_no=failed["invoice_no"], error=str(e))
+        if isinstance(e, HTTPException):
+            # The render workers are down, not this invoice's data.
+            raise HTTPException(status_code=e.status_code, detail=f"{e.detail}; no invoice of the batch was created",
+                                headers=e.headers)
+        raise HTTPException(status_code=400, detail=f"Invoice {failed['invoice_no']} ({failed['customer']}) failed to render, "
+                                                    f"no invoice of the batch was created: {e}")
+    rendered = [(it, data, pdf) for (it, data), pdf in zip(invoices, pdfs)]
+
+    await run_in_threadpool(outbox.append_many, [(it, year, data) for it, data in invoices])
+    await run_in_threadpool(lambda: [cache_pdf(it, year, data, pdf) for it, data, pdf in rendered])
+
+    filename = f"invoices_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return StreamingResponse(zip_invoices(rendered), media_type="application/zip", headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.post("/invoices/sync")
+async def sync_invoices(records: list[dict]):
+    # Invoices a client rendered under its own numbers while it could not
+    # reach the API. Each one is numbered again from our sequence, so it can
+    # never replace an invoice the API created, and the response maps the
+    # client's numbers to ours. A record sent with the Idempotency-Key of a
+    # create that did reach us gets that invoice's number instead of a new one.
+    if len(records) > BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_LIMIT} invoices per sync")
+    parsed = []
+    for i, r in enumerate(records):
+        it = str(r.get("invoice_type", "")).upper()
+        payload = r.get("data") or {}
+        if it not in INVOICE_TYPES or not payload.get("invoice_no"):
+            raise HTTPException(status_code=400, detail=f"Record {i}: needs a valid invoice_type and data.invoice_no")
+        try:
+            year = int(r.get("year") or str(payload.get("date", ""))[:4])
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Record {i}: needs a year")
+        parsed.append((it, year, str(payload["invoice_no"]), payload, r.get("idempotency_key")))
+
+    numbers = [None] * len(parsed)
+    claimed = []
+    try:
+        for i, (it, year, local_no, payload, key) in enumerate(parsed):
+            if not key:
+                continue
+            # The create carried the invoice before the client numbered it.
+            previous = await run_in_threadpool(idempotency.claim, key, fingerprint(it, dict(payload, invoice_no="")))
+            if previous:
+                numbers[i] = (previous[1], previous[2])
+            else:
+                claimed.append(i)
+    except (ValueError, KeyReused, KeyInProgress) as e:
+        for i in claimed:
+            await run_in_threadpool(idempotency.release, parsed[i][4])
+        status = 409 if isinstance(e, KeyInProgress) else 422 if isinstance(e, KeyReused) else 400
+        raise HTTPException(status_code=status, detail=str(e))
+
+    try:
+        # One contiguous block of numbers per counter and year.
+        counters = {}
+        for i, (it, year, *_) in enumerate(parsed):
+            if numbers[i] is None:
+                block = (counter_for(it), year)
+                counters[block] = counters.get(block, 0) + 1
+        next_no = {}
+        for (typ, year), count in counters.items():
+            next_no[(typ, year)] = await run_in_threadpool(sequence.allocate, typ, year, count)
+        entries, keys = [], []
+        for i, (it, year, local_no, payload, key) in enumerate(parsed):
+            if numbers[i] is None:
+                block = (counter_for(it), year)
+                numbers[i] = (year, format_number(next_no[block]))
+                next_no[block] += 1
+                entries.append((it, year, invoice_data(it, numbers[i][1], payload)))
+                keys.append(key)
+        await run_in_threadpool(outbox.append_many, entries)
+    except Exception:
+        for i in claimed:
+            await run_in_threadpool(idempotency.release, parsed[i][4])
+        raise
+    for (it, year, data), key in zip(entries, keys):
+        if key:
+            await run_in_threadpool(idempotency.complete, key, it, year, data["invoice_no"], data)
+    FALLBACKS.inc(len(entries), kind="offline_sync")
+    return {
+        "accepted": len(entries),
+        "invoices": [{"invoice_type": it, "year": year, "local_no": local_no, "invoice_no": inv_no}
+                     for (it, _, local_no, _, _), (year, inv_no) in zip(parsed, numbers)],
+    }
+
+def invoice_response(pdf, data, replayed=False, profile_id=None):
+    headers = {
+        "Content-Disposition": f"attachment; filename={invoice_filename(data)}",
+        "X-Invoice-No": data["invoice_no"],
+    }
+    if replayed:
+        headers["Idempotent-Replayed"] = "true"
+    if profile_id:
+        headers["X-Profile-Id"] = profile_id
+    return Response(pdf, media_type="application/pdf", headers=headers)
+
+async def cached_invoice_pdf(it, year, data):
+    pdf = await run_in_threadpool(pdf_cache.get, digest(it, data))
+    if pdf is None:
+        pdf = await render_and_cache(it, year, data)
+    return pdf
 
 @app.post("/invoices/{invoice_type}")
-def create_invoice(invoice_type: str, payload: dict):
+async def create_invoice(invoice_type: str, payload: dict, request: Request):
+    it = checked_invoice_type(invoice_type)
+    client_key = authenticated_key(request)
+    priority = request_priority(client_key)
     try:
-        it = invoice_type.upper()
-        typ = "PROFORMA" if it == "PROFORMA" else "SALES"
-        inv_no = next_invoice_number(typ)
-        price = safe_float(payload.get("price", 0))
-        down = safe_float(payload.get("down", 0))
-        is_leasing = it == "SALES-LEASING"
-        balance = 0.0 if it == "SALES-CASH" else max(price - down, 0.0)
-        data = {
-            "invoice_no": inv_no,
-            "date": payload.get("date", datetime.now().strftime("%Y-%m-%d")),
-            "customer": payload.get("customer", ""),
-            "cust_addr": payload.get("cust_addr", ""),
-            "delivery": payload.get("delivery", ""),
-            "nic": payload.get("nic", ""),
-            "price": price,
-            "down": down,
-            "balance": balance,
-            "is_leasing": is_leasing,
-            "model": payload.get("model", ""),
-            "engine": payload.get("engine", ""),
-            "chassis": payload.get("chassis", ""),
-            "color": payload.get("color", ""),
-            "finance_company": payload.get("finance_company", ""),
-            "finance_address": payload.get("finance_address", ""),
-            "dealer": payload.get("dealer", ""),
-        }
-        if it == "PROFORMA":
-            pdf = build_proforma_pdf(data)
-        else:
-            pdf = build_sales_pdf(data)
-        
-        write_invoice_csv(it, data)
-        
-        filename = f"{inv_no}_{data['customer'].replace(' ', '_')}.pdf"
-        return StreamingResponse(pdf, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename={filename}"})
+        await run_in_threadpool(rate_limiter.take, client_id(request, client_key))
+    except admission.Rejected as e:
+        raise too_many_requests(e, "rate", priority)
+    key = request.headers.get("idempotency-key")
+    if key:
+        # A retry of a request we already served gets the same invoice back.
+        try:
+            previous = await run_in_threadpool(idempotency.claim, key, fingerprint(it, payload))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except KeyReused as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except KeyInProgress as e:
+            raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+        if previous:
+            it, year, inv_no, data = previous
+            metrics.log_event("invoice_replayed", invoice_type=it, invoice_no=inv_no)
+            return invoice_response(await cached_invoice_pdf(it, year, data), data, replayed=True)
+
+    # Each stage is timed into invoice_stage_seconds and the request's log line;
+    # the CSV, index and Supabase writes happen later, in the outbox sinks.
+    timings = {}
+    started = time.perf_counter()
+    mode = profiling.choose(request.headers.get("x-profile"), PROFILING, PROFILE_SAMPLE, PROFILE_MODE)
+    profile = (profiles.new_id(), mode) if mode else None
+    try:
+        year = datetime.now().year
+        with metrics.span(STAGE_SECONDS, timings, "queue", invoice_type=it):
+            granted = await render_queue.acquire(priority)
+        try:
+            with metrics.span(STAGE_SECONDS, timings, "number", invoice_type=it):
+                inv_no = await run_in_threadpool(next_invoice_number, it)
+            data = invoice_data(it, inv_no, payload)
+            with metrics.span(STAGE_SECONDS, timings, "render", invoice_type=it):
+                pdf = await render_and_cache(it, year, data, profile)
+        finally:
+            render_queue.release(granted)
+        with metrics.span(STAGE_SECONDS, timings, "journal", invoice_type=it):
+            await run_in_threadpool(write_invoice_csv, it, data)
+        if key:
+            with metrics.span(STAGE_SECONDS, timings, "idempotency", invoice_type=it):
+                await run_in_threadpool(idempotency.complete, key, it, year, inv_no, data)
+    except admission.Rejected as e:
+        if key:
+            await run_in_threadpool(idempotency.release, key)
+        raise too_many_requests(e, "queue", priority)
     except Exception as e:
+        stage = list(timings)[-1] if timings else "request"
+        elapsed = time.perf_counter() - started
+        STAGE_FAILURES.inc(stage=stage, invoice_type=it)
+        REQUEST_SECONDS.observe(elapsed, invoice_type=it, status="error")
+        metrics.log_event("invoice_failed", invoice_type=it, stage=stage, error=str(e),
+                          total_ms=round(elapsed * 1000, 2), stages_ms=timings)
+        if key:
+            await run_in_threadpool(idempotency.release, key)
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+    elapsed = time.perf_counter() - started
+    REQUEST_SECONDS.observe(elapsed, invoice_type=it, status="ok")
+    metrics.log_event("invoice_created", invoice_type=it, invoice_no=inv_no,
+                      total_ms=round(elapsed * 1000, 2), stages_ms=timings,
+                      profile_id=profile[0] if profile else None)
+    log_first_pdf()
+    return invoice_response(pdf, data, profile_id=profile[0] if profile else None)
+
+@app.get("/warmup")
+async def warmup():
+    # Point a scheduled ping or deploy hook here: it loads ReportLab, the
+    # Supabase client, NumPy and the render workers so the next real request
+    # does not pay for them.
+    timings = {}
+    started = time.perf_counter()
+    await run_in_threadpool(renderer.warm)
+    timings["renderer"] = time.perf_counter() - started
+    started = time.perf_counter()
+    if db.configured:
+        await run_in_threadpool(lambda: db.client)
+    timings["db"] = time.perf_counter() - started
+    started = time.perf_counter()
+    await run_in_threadpool(snapshot.columns)
+    timings["analytics"] = time.perf_counter() - started
+    started = time.perf_counter()
+    await asyncio.gather(*[run_render(warm_job, renderer) for _ in range(RENDER_WORKERS)])
+    timings["render_workers"] = time.perf_counter() - started
+    return {
+        "timings_ms": {k: round(v * 1000, 1) for k, v in timings.items()},
+        "since_import_ms": round((time.perf_counter() - IMPORT_STARTED) * 1000, 1),
+    }
+
+@app.get("/debug/profiles/{profile_id}")
+def get_profile(profile_id: str, format: str = "json"):
+    # format=json: summary with the slowest functions (cprofile) or hottest stacks (sample);
+    # format=pstats: the raw cProfile dump; format=collapsed: stacks for flamegraph.pl/speedscope.
+    if not (PROFILING or PROFILE_SAMPLE):
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    meta = profiles.load(profile_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "json":
+        return meta
+    ext = {"pstats": "prof", "collapsed": "collapsed"}.get(format)
+    if ext is None or not os.path.exists(profiles.file(profile_id, ext)):
+        raise HTTPException(status_code=400, detail=f"Profile {profile_id} ({meta['mode']}) has no {format} output")
+    media_type = "text/plain" if ext == "collapsed" else "application/octet-stream"
+    return FileResponse(profiles.file(profile_id, ext), media_type=media_type, filename=f"{profile_id}.{ext}")
+
+@app.get("/metrics")
+def get_metrics():
+    # Per process: with several uvicorn workers, scrape each one.
+    return Response(metrics.exposition(), media_type=metrics.CONTENT_TYPE)
+
+LIST_LIMIT = 500
+
+@app.get("/invoices")
+def list_invoices(type: str = None, year: int = None, date_from: str = None, date_to: str = None,
+                  customer: str = None, dealer: str = None, model: str = None,
+                  cursor: str = None, limit: int = 50):
+    if not 1 <= limit <= LIST_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {LIST_LIMIT}")
+    try:
+        items, next_cursor = store.search(
+            invoice_type=type.upper() if type else None, year=year, date_from=date_from, date_to=date_to,
+            customer=customer, dealer=dealer, model=model, cursor=cursor, limit=limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/invoices/export")
+def export_invoices(format: str = "csv", gzip: bool = False, type: str = None, year: int = None,
+                    date_from: str = None, date_to: str = None, customer: str = None,
+                    dealer: str = None, model: str = None):
+    fmt = format.lower()
+    if fmt not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.FORMATS)}")
+    chunks = export.stream(
+        store, fmt, gzip, invoice_type=type.upper() if type else None, year=year, date_from=date_from,
+        date_to=date_to, customer=customer, dealer=dealer, model=model,
+    )
+    media_type = "application/gzip" if gzip else export.FORMATS[fmt][0]
+    filename = export.filename(fmt, gzip, datetime.now().strftime("%Y%m%d_%H%M%S"))
+    return StreamingResponse(chunks, media_type=media_type, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+def cached_pdf(row):
+    """PDF bytes of a stored invoice from the cache, rendered again only if evicted."""
+    it, year = row["invoice_type"], row["year"]
+    for _, _, key in pdf_cache.lookup(row["invoice_no"], it, year):
+        pdf = pdf_cache.get(key)
+        if pdf is not None:
+            return pdf
+    FALLBACKS.inc(kind="pdf_rerender")
+    data = invoice_data(it, row["invoice_no"], row)
+    pool = render_pool()
+    try:
+        pdf = pool.submit(render_job, renderer, it, data).result()
+    except BrokenProcessPool:
+        replace_render_pool(pool)
+        pdf = render_pool().submit(render_job, renderer, it, data).result()
+    cache_pdf(it, year, data, pdf)
+    return pdf
+
+@app.get("/invoices/print-run")
+def print_run(date: str = None, type: str = None):
+    day = date or datetime.now().strftime("%Y-%m-%d")
+    try:
+        datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD")
+    it = type.upper() if type else None
+    rows = list(store.iter_search(invoice_type=it, date_from=day, date_to=day))
+    if not rows:
+        raise HTTPException(status_code=404, detail="No invoices on this date")
+    if len(rows) > BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_LIMIT} invoices per print run; filter by type")
+    # Oldest first, the order they were issued in.
+    rows.sort(key=lambda r: r["id"])
+    pdf = printrun.merge(cached_pdf(row) for row in rows)
+    headers = {
+        "Content-Disposition": f"attachment; filename={printrun.filename(day, it)}",
+        "X-Invoice-Count": str(len(rows)),
+    }
+    return Response(content=pdf, media_type="application/pdf", headers=headers)
+
+@app.get("/reports/summary")
+def report_summary(group_by: str = "month", year: int = None, date_from: str = None, date_to: str = None):
+    groups = [g.strip() for g in group_by.split(",") if g.strip()]
+    try:
+        snapshot.refresh(store)
+        rows = snapshot.summary(groups, year=year, date_from=date_from, date_to=date_to)
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return {"group_by": groups, "rows": rows}
+
+@app.get("/reports/statement")
+def dealer_statement(dealer: str, month: str = None, date_from: str = None, date_to: str = None, type: str = None):
+    if month:
+        try:
+            datetime.strptime(month, "%Y-%m")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="month must be YYYY-MM")
+        date_from, date_to, period = f"{month}-01", f"{month}-31", month
+    elif date_from or date_to:
+        period = f"{date_from or 'start'} to {date_to or datetime.now().strftime('%Y-%m-%d')}"
+    else:
+        raise HTTPException(status_code=400, detail="Pass month or date_from/date_to")
+    rows = store.iter_statement(dealer=dealer, date_from=date_from, date_to=date_to,
+                                invoice_type=type.upper() if type else None)
+    filename = statement.filename(dealer, month or datetime.now().strftime("%Y%m%d"))
+    return StreamingResponse(statement.stream(rows, dealer, period), media_type="application/pdf",
+                             headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.get("/invoices/{invoice_no}/pdf")
+async def get_invoice_pdf(invoice_no: str, request: Request, type: str = None, year: int = None):
+    it = type.upper() if type else None
+    cached = await run_in_threadpool(pdf_cache.lookup, invoice_no, it, year)
+    if len(cached) > 1:
+        raise HTTPException(status_code=409, detail="Several invoices have this number; pass type and year")
+    if cached:
+        it, year, key = cached[0]
+        path = await run_in_threadpool(pdf_cache.open, key)
+    else:
+        path = None
+    if path is None:
+        # Not cached (or evicted): render again from the stored invoice, same number.
+        rows = await run_in_threadpool(store.get, invoice_no, it, year)
+        if not rows:
+            raise HTTPException(status_code=404, detail="Invoice not found")
+        if len(rows) > 1:
+            raise HTTPException(status_code=409, detail="Several invoices have this number; pass type and year")
+        row = rows[0]
+        it, year = row["invoice_type"], row["year"]
+        data = invoice_data(it, row["invoice_no"], row)
+        FALLBACKS.inc(kind="pdf_rerender")
+        await render_and_cache(it, year, data)
+        key = (await run_in_threadpool(pdf_cache.lookup, invoice_no, it, year))[0][2]
+        path = await run_in_threadpool(pdf_cache.open, key)
+        if path is None:
+            raise HTTPException(status_code=500, detail="Could not cache the rendered PDF")
+
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="application/pdf", headers=headers, filename=f"{it}_{year}_{invoice_no}.pdf")
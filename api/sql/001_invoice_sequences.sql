@@ -0,0 +1,35 @@
+-- Atomic invoice numbering for Supabase.
+--
+-- reserve_invoice_numbers bumps the counter for (invoice_type, year) by
+-- p_count in a single upsert and returns the last number reserved, so the
+-- caller owns (result - p_count + 1) .. result.
+
+create table if not exists invoice_sequences (
+    invoice_type text not null,
+    year int not null,
+    last_no int not null default 0,
+    primary key (invoice_type, year)
+);
+
+-- Start from the numbers already used. Sales rows are stored as
+-- SALES-CASH / SALES-LEASING but share the SALES counter.
+insert into invoice_sequences (invoice_type, year, last_no)
+select case when invoice_type like 'SALES%' then 'SALES' else invoice_type end,
+       year,
+       max(invoice_no::int)
+from invoices
+where invoice_no ~ '^[0-9]+$'
+group by 1, 2
+on conflict (invoice_type, year) do update
+    set last_no = greatest(invoice_sequences.last_no, excluded.last_no);
+
+create or replace function reserve_invoice_numbers(p_type text, p_year int, p_count int default 1)
+returns int
+language sql
+as $$
+    insert into invoice_sequences (invoice_type, year, last_no)
+    values (p_type, p_year, p_count)
+    on conflict (invoice_type, year) do update
+        set last_no = invoice_sequences.last_no + excluded.last_no
+    returning last_no;
+$$;
@@ -0,0 +1,6 @@
+-- One row per invoice so the API's write-behind outbox can upsert batches
+-- and replay them after a failure without creating duplicates.
+-- Remove any existing duplicate (invoice_type, year, invoice_no) rows first.
+
+create unique index if not exists invoices_type_year_no
+    on invoices (invoice_type, year, invoice_no);
@@ -0,0 +1,16 @@
+-- Carry counters over from numbers issued outside Supabase, such as a
+-- desktop invoice_log.csv brought in by `python -m api.import_legacy`.
+--
+-- raise_invoice_sequence moves the counter for (invoice_type, year) up to
+-- p_last_no, never down, and returns the counter's value afterwards.
+
+create or replace function raise_invoice_sequence(p_type text, p_year int, p_last_no int)
+returns int
+language sql
+as $$
+    insert into invoice_sequences (invoice_type, year, last_no)
+    values (p_type, p_year, p_last_no)
+    on conflict (invoice_type, year) do update
+        set last_no = greatest(invoice_sequences.last_no, excluded.last_no)
+    returning last_no;
+$$;
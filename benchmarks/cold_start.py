@@ -0,0 +1,112 @@
+"""API cold start: import time, time to first PDF and where the import goes.
+
+Every run is a fresh interpreter on a fresh copy of api/ and invoice_core/,
+like a new serverless instance: it imports api.main, starts the app and
+posts one invoice. ``--warmup`` calls GET /warmup before the invoice, the
+way a scheduled ping would. The breakdown sums ``python -X importtime`` by
+the top-level package that api.main pulled in.
+
+    python benchmarks/cold_start.py --runs 5
+    python benchmarks/cold_start.py --runs 5 --warmup
+"""
+import argparse
+import collections
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import api.main
+imported = time.perf_counter()
+reportlab_loaded = "reportlab" in sys.modules
+from fastapi.testclient import TestClient
+with TestClient(api.main.app) as client:
+    t0 = time.perf_counter()
+    if sys.argv[1] == "1":
+        r = client.get("/warmup")
+        r.raise_for_status()
+    t1 = time.perf_counter()
+    r = client.post("/invoices/SALES-CASH", json={"customer": "Cold Start", "price": 1000})
+    r.raise_for_status()
+    t2 = time.perf_counter()
+print(json.dumps({
+    "import": (imported - started) * 1000,
+    "warmup": (t1 - t0) * 1000,
+    "first_pdf": (t2 - t1) * 1000,
+    "reportlab_loaded": reportlab_loaded,
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """Cumulative microseconds per top-level package imported directly by api.main."""
+    totals = collections.Counter()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        if depth == 0 and name.strip() == "api.main":
+            break
+        if depth == 1:
+            totals[name.strip().split(".")[0]] += int(cumulative)
+    return totals
+
+
+def run_once(warmup):
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("api", "invoice_core"):
+            shutil.copytree(os.path.join(ROOT, name), os.path.join(tmp, name),
+                            ignore=shutil.ignore_patterns("__pycache__", "*.db", "*.csv", "*.jsonl", "pdf_cache", "invoice_analytics"))
+        for name in ("download.png", "singer_logo.png"):
+            if os.path.exists(os.path.join(ROOT, name)):
+                shutil.copy(os.path.join(ROOT, name), tmp)
+        env = dict(os.environ, SUPABASE_URL="", SUPABASE_KEY="")
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", CHILD, "1" if warmup else "0"],
+            cwd=tmp, env=env, capture_output=True, text=True, check=True,
+        )
+    return json.loads(proc.stdout.strip().splitlines()[-1]), parse_importtime(proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true", help="call GET /warmup before the first invoice")
+    parser.add_argument("--top", type=int, default=10, help="packages to list in the import breakdown")
+    args = parser.parse_args()
+
+    results, breakdown = [], collections.defaultdict(list)
+    for _ in range(args.runs):
+        result, totals = run_once(args.warmup)
+        results.append(result)
+        for name, us in totals.items():
+            breakdown[name].append(us / 1000)
+
+    def median(key):
+        return statistics.median(r[key] for r in results)
+
+    print(f"import api.main     {median('import'):8.1f} ms")
+    if args.warmup:
+        print(f"GET /warmup         {median('warmup'):8.1f} ms")
+    print(f"first PDF request   {median('first_pdf'):8.1f} ms")
+    print(f"import to first PDF {median('import') + median('warmup') + median('first_pdf'):8.1f} ms")
+    print(f"ReportLab loaded by the import: {any(r['reportlab_loaded'] for r in results)}")
+    print("\nimport time by package (median, -X importtime, includes its own overhead):")
+    ranked = sorted(breakdown.items(), key=lambda kv: -statistics.median(kv[1]))
+    for name, values in ranked[:args.top]:
+        print(f"  {name:<24} {statistics.median(values):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
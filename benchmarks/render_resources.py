@@ -0,0 +1,71 @@
+"""Per-invoice render latency with and without the shared resource cache.
+
+"cold" clears invoice_core.resources before every PDF, which is what each
+render used to pay (new stylesheet, new styles, logos decoded from disk).
+"warm" keeps the cache between renders.
+
+    python benchmarks/render_resources.py --iterations 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from invoice_core import resources
+from invoice_core.renderer import Renderer
+
+SAMPLE = {
+    "invoice_no": "0001",
+    "date": "2025-01-15",
+    "dealer": "Gunawardhana Enterprises, Beliatta Road, Tangalle",
+    "customer": "Sample Customer",
+    "cust_addr": "No. 1, Main Street, Tangalle",
+    "delivery": "No. 1, Main Street, Tangalle",
+    "finance_company": "Vallibel Finance PLC",
+    "finance_address": "No. 54, Beliatta Road, Tangalle",
+    "nic": "901234567V",
+    "model": "APE AUTO DX PASSENGER (Diesel)",
+    "engine": "ENG123456",
+    "chassis": "CHS123456",
+    "color": "Blue",
+    "price": 1250000.0,
+    "down": 250000.0,
+    "balance": 1000000.0,
+    "show_finance": False,
+    "is_leasing": True,
+}
+
+
+def run(builder, out_path, iterations, cold):
+    timings = []
+    for _ in range(iterations):
+        if cold:
+            resources.clear()
+        started = time.perf_counter()
+        builder(SAMPLE, out_path)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, "invoice.pdf")
+        renderer = Renderer(os.path.join(ROOT, "download.png"), os.path.join(ROOT, "singer_logo.png"))
+        for name, builder in (("sales", renderer.sales), ("proforma", renderer.proforma)):
+            builder(SAMPLE, out_path)
+            cold = run(builder, out_path, args.iterations, cold=True)
+            warm = run(builder, out_path, args.iterations, cold=False)
+            print(f"{name:<9} cold {cold:7.2f} ms   warm {warm:7.2f} ms   saved {cold - warm:6.2f} ms/invoice")
+
+
+if __name__ == "__main__":
+    main()
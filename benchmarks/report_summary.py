@@ -0,0 +1,84 @@
+"""Monthly sales summary: columnar snapshot vs re-parsing invoices.csv.
+
+Generates a year of synthetic invoices, then times the month x model x
+dealer totals computed both ways.
+
+    python benchmarks/report_summary.py --rows 100000
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from invoice_core import export
+from invoice_core.analytics import InvoiceSnapshot
+from invoice_core.store import InvoiceStore
+
+MODELS = ["APE AUTO DX PASSENGER (Diesel)", "APE Xtra LDX"]
+DEALERS = [f"Dealer {i}" for i in range(12)]
+
+
+def csv_summary(path):
+    totals = {}
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            key = (r["date"][:7], r["model"], r["dealer"])
+            t = totals.setdefault(key, [0, 0.0, 0.0, 0.0])
+            t[0] += 1
+            t[1] += float(r["price"])
+            t[2] += float(r["down"])
+            t[3] += float(r["balance"])
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = InvoiceStore(os.path.join(tmp, "invoices.db"))
+        store.add_many(
+            ("SALES-LEASING" if i % 3 else "SALES-CASH", 2025, {
+                "invoice_no": f"{i + 1:04d}",
+                "date": f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+                "model": MODELS[i % 2],
+                "dealer": DEALERS[i % len(DEALERS)],
+                "price": 1250000.0 + i,
+                "down": 250000.0,
+                "balance": 1000000.0 + i,
+            })
+            for i in range(args.rows)
+        )
+        csv_path = os.path.join(tmp, "invoices.csv")
+        export.to_file(store, csv_path, "csv")
+        snapshot = InvoiceSnapshot(os.path.join(tmp, "analytics"))
+
+        started = time.perf_counter()
+        snapshot.refresh(store)
+        print(f"snapshot build  {(time.perf_counter() - started) * 1000:9.1f} ms  ({args.rows:,} rows, one-off)")
+
+        started = time.perf_counter()
+        expected = csv_summary(csv_path)
+        print(f"csv re-parse    {(time.perf_counter() - started) * 1000:9.1f} ms")
+
+        group_by = ("month", "model", "dealer")
+        snapshot.summary(group_by, year=2025)
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            rows = snapshot.summary(group_by, year=2025)
+        print(f"snapshot        {(time.perf_counter() - started) * 1000 / args.repeat:9.1f} ms")
+
+    got = {(r["month"], r["model"], r["dealer"]): r["count"] for r in rows}
+    if got != {k: v[0] for k, v in expected.items()}:
+        print("MISMATCH between snapshot and csv totals")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Stress test for the invoice number allocators.
+
+Starts several processes that all allocate from one shared counter and checks
+the combined result has no duplicates. The file backend must also be gap-free
+(exactly 1..N). The leased backend runs against the SQLite stand-in for the
+Supabase RPC, where unused parts of a lease are allowed to be skipped.
+
+    python benchmarks/sequence_stress.py --processes 8 --per-process 500
+    python benchmarks/sequence_stress.py --backend leased --lease-size 50
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from invoice_core.sequence import FileSequenceAllocator, LeasedSequenceAllocator, SQLiteSequenceStore
+
+
+def worker(backend, path, lease_size, count, start_event):
+    if backend == "leased":
+        allocator = LeasedSequenceAllocator(SQLiteSequenceStore(path).reserve, lease_size)
+    else:
+        allocator = FileSequenceAllocator(path, compact_after=256)
+    start_event.wait()
+    return [allocator.next_number("SALES", 2025) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["file", "leased"], default="file")
+    parser.add_argument("--lease-size", type=int, default=50)
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--per-process", type=int, default=500)
+    parser.add_argument("--min-rate", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "invoice_log.csv" if args.backend == "file" else "sequences.db")
+        if args.backend == "leased":
+            SQLiteSequenceStore(path)
+        with multiprocessing.Manager() as manager:
+            start_event = manager.Event()
+            with multiprocessing.Pool(args.processes) as pool:
+                jobs = [pool.apply_async(worker, (args.backend, path, args.lease_size, args.per_process, start_event)) for _ in range(args.processes)]
+                time.sleep(0.5)
+                started = time.perf_counter()
+                start_event.set()
+                numbers = [n for job in jobs for n in job.get()]
+                elapsed = time.perf_counter() - started
+
+    total = args.processes * args.per_process
+    duplicates = len(numbers) - len(set(numbers))
+    gap_free = sorted(numbers) == list(range(1, total + 1))
+    rate = total / elapsed
+    print(f"[{args.backend}] {total} allocations across {args.processes} processes in {elapsed:.3f}s ({rate:,.0f}/s)")
+    print(f"duplicates: {duplicates}, gap-free: {gap_free}")
+    if duplicates or (args.backend == "file" and not gap_free) or rate < args.min_rate:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
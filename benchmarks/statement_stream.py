@@ -0,0 +1,64 @@
+"""Time and peak memory of a long dealer statement.
+
+Fills a fresh store with one dealer's month of synthetic invoices spread
+over a few finance companies, then streams the statement to a file and
+reports its size, time and the peak Python allocation (tracemalloc)
+while it was written. The peak should stay flat as --rows grows.
+
+    python benchmarks/statement_stream.py --rows 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.store_lookup import synthetic
+from invoice_core import statement
+from invoice_core.store import InvoiceStore
+
+DEALER = "Gunawardhana Enterprises, Tangalle"
+FINANCE = ["Vallibel Finance PLC", "LB Finance PLC", "People's Leasing", ""]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = InvoiceStore(os.path.join(tmp, "invoices.db"))
+        entries = []
+        for i in range(args.rows):
+            data = dict(synthetic(i), date=f"2025-03-{i % 28 + 1:02d}", dealer=DEALER, finance_company=FINANCE[i % len(FINANCE)])
+            entries.append(("SALES-LEASING", 2025, data))
+        store.add_many(entries)
+        del entries
+
+        # Load ReportLab's font metrics outside the measurement.
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+        stringWidth("0", "Helvetica", 8)
+
+        path = os.path.join(tmp, "statement.pdf")
+        tracemalloc.start()
+        started = time.perf_counter()
+        chunks = 0
+        with open(path, "wb") as f:
+            rows = store.iter_statement(dealer=DEALER, date_from="2025-03-01", date_to="2025-03-31")
+            for chunk in statement.stream(rows, DEALER, "2025-03"):
+                f.write(chunk)
+                chunks += 1
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        size = os.path.getsize(path)
+
+    print(f"{args.rows} invoices: {size / 1024:.0f} KB in {chunks} chunks, {elapsed:.2f} s, "
+          f"peak allocation {peak / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
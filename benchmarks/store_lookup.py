@@ -0,0 +1,85 @@
+"""Lookup latency of the indexed invoice store at a large row count.
+
+Fills a fresh store with synthetic invoices, then times random lookups by
+chassis, NIC, engine and invoice number, and one linear scan of the same
+data exported as invoices.csv for comparison.
+
+    python benchmarks/store_lookup.py --rows 1000000
+"""
+import argparse
+import csv
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from invoice_core.store import COLUMNS, InvoiceStore
+
+
+def synthetic(i):
+    return {
+        "invoice_no": f"{i + 1:04d}",
+        "date": f"{2015 + i // 100000}-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+        "customer": f"Customer {i}",
+        "nic": f"{900000000 + i}V",
+        "model": "APE AUTO DX PASSENGER (Diesel)",
+        "engine": f"ENG{i:08d}",
+        "chassis": f"CHS{i:08d}",
+        "price": 1250000.0,
+        "down": 250000.0,
+        "balance": 1000000.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--max-ms", type=float, default=5.0, help="fail if p99 chassis lookup exceeds this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = InvoiceStore(os.path.join(tmp, "invoices.db"))
+        started = time.perf_counter()
+        batch = 10000
+        for lo in range(0, args.rows, batch):
+            store.add_many(("SALES", None, synthetic(i)) for i in range(lo, min(lo + batch, args.rows)))
+        print(f"loaded {args.rows:,} rows in {time.perf_counter() - started:.1f}s")
+
+        for field, fmt in (("chassis", "CHS{:08d}"), ("nic", "{}V"), ("engine", "ENG{:08d}")):
+            timings = []
+            for _ in range(args.lookups):
+                i = random.randrange(args.rows)
+                value = fmt.format(900000000 + i if field == "nic" else i)
+                t = time.perf_counter()
+                found = store.chassis_invoiced(value) if field == "chassis" else store.find(field, value)
+                timings.append((time.perf_counter() - t) * 1000)
+                assert found, value
+            timings.sort()
+            p99 = timings[int(len(timings) * 0.99) - 1]
+            print(f"{field:<10} p50 {statistics.median(timings):.3f} ms   p99 {p99:.3f} ms")
+            if field == "chassis":
+                chassis_p99 = p99
+
+        csv_path = os.path.join(tmp, "invoices.csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(COLUMNS)
+            for r in store._connect().execute(f"SELECT {', '.join(COLUMNS)} FROM invoices"):
+                w.writerow(r)
+        target = f"CHS{args.rows - 1:08d}"
+        t = time.perf_counter()
+        with open(csv_path, "r", newline="", encoding="utf-8") as f:
+            any(r["chassis"] == target for r in csv.DictReader(f))
+        print(f"csv scan   {(time.perf_counter() - t) * 1000:.1f} ms")
+
+    if chassis_p99 > args.max_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
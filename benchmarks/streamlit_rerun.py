@@ -0,0 +1,62 @@
+"""Streamlit rerun latency as the invoice history grows.
+
+Runs web_app.py under streamlit's AppTest against a scratch copy of the app
+directory seeded with N invoices, and times a plain rerun and a "View Past
+Invoices" click after the caches are warm.
+
+    python benchmarks/streamlit_rerun.py --sizes 1000 100000 1000000
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.store_lookup import synthetic
+from invoice_core.store import InvoiceStore
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ("web_app.py", "download.png", "singer_logo.png"):
+                if os.path.exists(os.path.join(ROOT, name)):
+                    shutil.copy(os.path.join(ROOT, name), tmp)
+            os.symlink(os.path.join(ROOT, "invoice_core"), os.path.join(tmp, "invoice_core"))
+            store = InvoiceStore(os.path.join(tmp, "invoices.db"))
+            for lo in range(0, size, 10000):
+                store.add_many(("SALES", 2025, synthetic(i)) for i in range(lo, min(lo + 10000, size)))
+
+            st.cache_resource.clear()
+            st.cache_data.clear()
+            at = AppTest.from_file(os.path.join(tmp, "web_app.py"), default_timeout=120)
+            at.run()
+            rerun = timed(at.run, args.repeat)
+            view = timed(lambda: at.button[1].click().run(), args.repeat)
+            print(f"{size:>9,} invoices   rerun {rerun:7.1f} ms   view past invoices {view:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Benchmark suite for the invoice hot paths, saved as JSON and checked against a baseline.
+
+Cases, all on synthetic customers in scratch directories:
+
+    render.sales / render.proforma / render.advance   PDFs per second per layout
+    allocate.file / allocate.leased                   numbers per second across N processes
+    write.csv                                         invoices.csv appends per second
+    write.local                                       web/desktop write_invoice_csv (CSV, index, snapshot)
+    write.journal                                     API write_invoice_csv (outbox append)
+    merge.page                                        print run merge time per invoice page
+    api.post.p50 / api.post.p95                       POST /invoices/SALES-CASH latency via TestClient
+
+    python benchmarks/suite.py                         # run, write benchmarks/results/latest.json
+    python benchmarks/suite.py --update-baseline       # ... and make it the baseline
+    python benchmarks/suite.py --only render,write     # a subset
+
+When benchmarks/baseline.json exists (or --baseline is given) every result
+is compared with it and the run exits with status 1 if any case got worse by
+more than --tolerance. Baselines are machine specific; record one on the
+machine that runs the comparison.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.render_resources import SAMPLE
+from benchmarks.sequence_stress import worker as allocation_worker
+from benchmarks.store_lookup import synthetic
+from invoice_core import printrun, records
+from invoice_core.analytics import InvoiceSnapshot
+from invoice_core.outbox import Outbox
+from invoice_core.renderer import Renderer
+from invoice_core.sequence import SQLiteSequenceStore
+from invoice_core.store import InvoiceStore
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+
+def customer(i):
+    return dict(SAMPLE, payment_method="Cash", **synthetic(i))
+
+
+def result(value, unit, better="higher"):
+    return {"value": round(value, 3), "unit": unit, "better": better}
+
+
+def bench_render(args, tmp):
+    renderer = Renderer(os.path.join(ROOT, "download.png"), os.path.join(ROOT, "singer_logo.png"))
+    out = {}
+    for kind in ("sales", "proforma", "advance"):
+        build = getattr(renderer, kind)
+        build(customer(0))
+        started = time.perf_counter()
+        for i in range(args.iterations):
+            build(customer(i))
+        out[f"render.{kind}"] = result(args.iterations / (time.perf_counter() - started), "pdf/s")
+    return out
+
+
+def bench_allocate(args, tmp):
+    out = {}
+    for backend in ("file", "leased"):
+        path = os.path.join(tmp, f"{backend}-sequence")
+        if backend == "leased":
+            SQLiteSequenceStore(path)
+        with multiprocessing.Manager() as manager:
+            start_event = manager.Event()
+            with multiprocessing.Pool(args.processes) as pool:
+                jobs = [pool.apply_async(allocation_worker, (backend, path, 50, args.allocations, start_event))
+                        for _ in range(args.processes)]
+                time.sleep(0.5)
+                started = time.perf_counter()
+                start_event.set()
+                numbers = [n for job in jobs for n in job.get()]
+                elapsed = time.perf_counter() - started
+        if len(numbers) != len(set(numbers)):
+            raise RuntimeError(f"{backend} allocator handed out duplicate numbers")
+        out[f"allocate.{backend}"] = result(len(numbers) / elapsed, f"numbers/s ({args.processes} processes)")
+    return out
+
+
+def bench_write(args, tmp):
+    out = {}
+    path = os.path.join(tmp, "invoices.csv")
+    started = time.perf_counter()
+    for i in range(args.rows):
+        records.append_csv(path, [("SALES", customer(i))])
+    out["write.csv"] = result(args.rows / (time.perf_counter() - started), "rows/s")
+
+    # What web_app.py and invoice_app.py do per invoice.
+    path = os.path.join(tmp, "local.csv")
+    store = InvoiceStore(os.path.join(tmp, "invoices.db"))
+    snapshot = InvoiceSnapshot(os.path.join(tmp, "analytics"))
+    started = time.perf_counter()
+    for i in range(args.rows):
+        data = customer(i)
+        records.append_csv(path, [("SALES", data)])
+        store.add("SALES", data, year=2025)
+        snapshot.refresh(store)
+    out["write.local"] = result(args.rows / (time.perf_counter() - started), "invoices/s")
+
+    # What the API does before answering; the sinks run later on the flusher thread.
+    outbox = Outbox(os.path.join(tmp, "outbox.jsonl"), {})
+    started = time.perf_counter()
+    for i in range(args.rows):
+        outbox.append("SALES-CASH", 2025, customer(i))
+    out["write.journal"] = result(args.rows / (time.perf_counter() - started), "invoices/s")
+    outbox.stop()
+    return out
+
+
+def bench_merge(args, tmp):
+    renderer = Renderer(os.path.join(ROOT, "download.png"), os.path.join(ROOT, "singer_logo.png"))
+    pdfs = [renderer.sales(customer(i)) for i in range(args.iterations)]
+    printrun.merge(pdfs[:2])
+    started = time.perf_counter()
+    printrun.merge(pdfs)
+    return {"merge.page": result((time.perf_counter() - started) * 1000 / len(pdfs), "ms/page", "lower")}
+
+
+API_CHILD = """
+import json, statistics, sys, time
+from fastapi.testclient import TestClient
+import api.main
+sys.path.append(sys.argv[2])
+from benchmarks.suite import customer
+timings = []
+with TestClient(api.main.app) as client:
+    client.get("/warmup").raise_for_status()
+    for i in range(int(sys.argv[1])):
+        started = time.perf_counter()
+        client.post("/invoices/SALES-CASH", json=customer(i)).raise_for_status()
+        timings.append((time.perf_counter() - started) * 1000)
+timings.sort()
+print(json.dumps({"p50": statistics.median(timings), "p95": timings[int(len(timings) * 0.95) - 1]}))
+"""
+
+
+def bench_api(args, tmp):
+    app_root = os.path.join(tmp, "app")
+    for name in ("api", "invoice_core"):
+        shutil.copytree(os.path.join(ROOT, name), os.path.join(app_root, name),
+                        ignore=shutil.ignore_patterns("__pycache__", "*.db", "*.csv", "*.jsonl", "pdf_cache", "invoice_analytics"))
+    for name in ("download.png", "singer_logo.png"):
+        if os.path.exists(os.path.join(ROOT, name)):
+            shutil.copy(os.path.join(ROOT, name), app_root)
+    env = dict(os.environ, SUPABASE_URL="", SUPABASE_KEY="", INVOICE_RATE_LIMIT="0")
+    proc = subprocess.run([sys.executable, "-c", API_CHILD, str(args.requests), ROOT],
+                          cwd=app_root, env=env, capture_output=True, text=True, check=True)
+    latency = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {
+        "api.post.p50": result(latency["p50"], "ms", "lower"),
+        "api.post.p95": result(latency["p95"], "ms", "lower"),
+    }
+
+
+CASES = {"render": bench_render, "allocate": bench_allocate, "write": bench_write, "merge": bench_merge, "api": bench_api}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, tolerance):
+    """Print each case against the baseline; returns the names that regressed."""
+    regressions = []
+    print(f"\n{'case':<18} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, now in current.items():
+        before = baseline.get(name)
+        if not before or not before["value"]:
+            print(f"{name:<18} {'-':>12} {now['value']:>12.2f}")
+            continue
+        change = now["value"] / before["value"] - 1
+        worse = -change if now["better"] == "higher" else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        print(f"{name:<18} {before['value']:>12.2f} {now['value']:>12.2f} {change:>+7.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", default=",".join(CASES), help="comma separated: " + ", ".join(CASES))
+    parser.add_argument("--iterations", type=int, default=50, help="PDFs rendered per layout")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--allocations", type=int, default=500, help="numbers allocated per process")
+    parser.add_argument("--rows", type=int, default=2000, help="invoices written per write case")
+    parser.add_argument("--requests", type=int, default=50, help="API requests timed")
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "latest.json"))
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown before a case counts as a regression")
+    args = parser.parse_args()
+
+    results = {}
+    for name in [n.strip() for n in args.only.split(",") if n.strip()]:
+        if name not in CASES:
+            parser.error(f"unknown case {name}; choose from {', '.join(CASES)}")
+        with tempfile.TemporaryDirectory() as tmp:
+            for case, value in CASES[name](args, tmp).items():
+                results[case] = value
+                print(f"{case:<18} {value['value']:>12.2f} {value['unit']}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nwrote {args.output}")
+
+    if args.update_baseline:
+        shutil.copy(args.output, args.baseline)
+        print(f"baseline updated: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,21 @@
+import logging
 import os
-import csv
 import sys
-import re
-import requests
+import queue
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from tkinter import *
-from tkinter import ttk, messagebox
-
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors
-    from reportlab.platypus import (
-        SimpleDocTemplate, Paragraph, Spacer,
-        Table, TableStyle, Image, KeepTogether, Frame, PageTemplate
-    )
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-except ImportError:
-    try:
-        from tkinter import messagebox
-        messagebox.showerror("Missing dependency", "ReportLab is not installed.\n\npip install reportlab")
-    except Exception:
-        pass
-    import sys
-    sys.exit(1)
+from tkinter import ttk, messagebox, simpledialog
+
+from invoice_core import export, printrun, records
+from invoice_core.records import safe_float, safe_filename
+from invoice_core.renderer import Renderer
+from invoice_core.sequence import FileSequenceAllocator
+from invoice_core.analytics import InvoiceSnapshot
+from invoice_core.apiclient import InvoiceApiClient
+from invoice_core.store import InvoiceStore
 
 
 # ============================================================
@@ -38,357 +31,49 @@ def resource_path(name):
     return os.path.join(base, name)
 
 INVOICE_LOG = os.path.join(app_dir(), "invoice_log.csv")
-
-def init_csv():
-    """Create CSV if missing."""
-    if not os.path.exists(INVOICE_LOG):
-        with open(INVOICE_LOG, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(["invoice_type", "year", "last_no"])
-
+sequence = FileSequenceAllocator(INVOICE_LOG)
 
 def next_invoice_number(inv_type):
-    year = datetime.now().year
-    found = False
-    last_no = 0
-    rows = []
-
-    init_csv()
-
-    with open(INVOICE_LOG, "r", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        rows = list(reader)
-
-    for row in rows:
-        if row and row[0] == inv_type and row[1] == str(year):
-            last_no = int(row[2])
-            found = True
-            break
-
-    new_no = last_no + 1
-
-    updated = False
-    for i, r in enumerate(rows):
-        if r and r[0] == inv_type and r[1] == str(year):
-            rows[i][2] = str(new_no)
-            updated = True
-
-    if not updated:
-        rows.append([inv_type, str(year), str(new_no)])
-
-    with open(INVOICE_LOG, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerows(rows)
-
-    return f"{new_no:04d}"
-
-
-def safe_float(v):
-    try:
-        return float(v)
-    except:
-        return 0.0
-
-def safe_filename(s):
-    return re.sub(r"[^A-Za-z0-9._-]+", "_", s.strip())[:60]
+    return records.next_invoice_number(sequence, inv_type)
 
 # ============================================================
 #                CSV STORAGE FOR INVOICE DETAILS
 # ============================================================
 INVOICES_CSV = os.path.join(app_dir(), "invoices.csv")
+INVOICES_DB = os.path.join(app_dir(), "invoices.db")
+ANALYTICS_DIR = os.path.join(app_dir(), "invoice_analytics")
 API_BASE_URL = os.environ.get("INVOICE_API_URL", "")
+OFFLINE_QUEUE = os.path.join(app_dir(), "offline_invoices.jsonl")
+# Nobody sees stdout of the desktop app: failures of the background threads go here.
+APP_LOG = os.path.join(app_dir(), "invoice_app.log")
+logger = logging.getLogger("invoice_app")
+
+# The task thread and the offline sync thread both record invoices.
+journal_lock = threading.Lock()
+
+def write_invoice_csv(invoice_type, data, year=None):
+    with journal_lock:
+        records.append_csv(INVOICES_CSV, [(invoice_type, data)])
+        store.add(invoice_type, data, year=year or datetime.now().year)
+    try:
+        snapshot.refresh(store)
+    except Exception:
+        logger.exception("Analytics snapshot refresh failed")
 
-def write_invoice_csv(invoice_type, data):
-    exists = os.path.exists(INVOICES_CSV)
-    with open(INVOICES_CSV, "a", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        if not exists:
-            w.writerow([
-                "invoice_type","invoice_no","date","customer","nic","cust_addr",
-                "delivery","model","engine","chassis","color","price","down",
-                "balance","finance_company","finance_address","dealer"
-            ])
-        w.writerow([
-            invoice_type,data["invoice_no"],data["date"],data["customer"],data["nic"],
-            data["cust_addr"],data["delivery"],data["model"],data["engine"],
-            data["chassis"],data["color"],data["price"],data["down"],
-            data["balance"],data["finance_company"],data["finance_address"],
-            data["dealer"]
-        ])
+store = InvoiceStore(INVOICES_DB)
+snapshot = InvoiceSnapshot(ANALYTICS_DIR)
+store.import_csv_if_empty(INVOICES_CSV)
 
 
 # ============================================================
 #                PDF GENERATION (SALES / PROFORMA)
 # ============================================================
-def generate_sales_pdf(data, out_path):
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+# The desktop build has always printed its footers without the credit line.
+renderer = Renderer(resource_path("download.png"), resource_path("singer_logo.png"), credit=False)
 
-    doc = SimpleDocTemplate(out_path, pagesize=A4,
-                            topMargin=45, bottomMargin=35,
-                            leftMargin=40, rightMargin=40)
-    styles = getSampleStyleSheet()
-    elements = []
-
-    # LOGO
-    try:
-        logo = Image(resource_path("download.png"), width=90, height=40)
-        logo.hAlign = "LEFT"
-        elements.append(logo)
-        elements.append(Spacer(1, 6))
-        small_style = ParagraphStyle(
-            'smallGray',
-            fontSize=9,
-            textColor=colors.gray,
-            leftIndent=3,
-            spaceAfter=10,
-            leading=9
-        )
-        elements.append(Paragraph("Authorized Dealer", small_style))
-    except:
-        pass
-
-    # FIXED FONT TAG
-    title = Paragraph("<b><font size=\"15\">SALES INVOICE</font></b>", styles["Title"])
-    subtitle = Paragraph(
-        f"<para align='center'><font size=\"10\">{data['dealer']}</font></para>",
-        styles["Normal"]
-    )
-
-    bill_line = Paragraph(
-        f"<para align='center'><b>Bill No: {data['invoice_no']}</b></para>",
-        styles["Normal"]
-    )
-
-    elements += [title, Spacer(1, 6), subtitle, Spacer(1, 20)]
-
-    # Finance info
-    if data.get("show_finance"):
-        fin = Paragraph(
-            f"<b>To:</b> {data['finance_company']}<br/><font size=\"9\">{data['finance_address']}</font>",
-            styles["Normal"]
-        )
-        elements += [fin, Spacer(1, 12)]
-
-    # Header Table
-    header = [
-        ["", "", "Date:", data["date"]],
-        ["", "", "Invoice No:", data["invoice_no"]],
-        ["Customer Name:", data["customer"], "", ""],
-        ["Address:", data["cust_addr"], "", ""],
-        ["NIC:", data["nic"], "", ""],
-    ]
-    t = Table(header, colWidths=[95, 250, 70, 90])
-    t.setStyle(TableStyle([
-        ("FONTNAME", (0,0), (-1,-1), "Helvetica-Bold")
-    ]))
-    elements += [t, Spacer(1, 20)]
-
-    # Vehicle details
-    v = [
-        ["Model", data["model"]],
-        ["Engine No", data["engine"]],
-        ["Chassis No", data["chassis"]],
-        ["Color", data["color"]],
-        ["Engine Capacity", "435.6 cc"],
-        ["Manufactured Year", "2025"],
-        ["Country of Origin", "India"],
-    ]
-    vt = Table(v, colWidths=[150, 250])
-    vt.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (0,-1), colors.whitesmoke),
-        ("GRID", (0,0), (-1,-1), 0.25, colors.gray),
-    ]))
-    elements += [
-        Paragraph("<b>Vehicle Details</b>", styles["Heading4"]),
-        Spacer(1, 8),
-        vt,
-        Spacer(1, 18)
-    ]
-
-    # Payment summary
-    label_price = "Vehicle Price" if not data.get("is_leasing") else "Total Price"
-    label_down = "Total Payment" if not data.get("is_leasing") else "Down Payment"
-    pay = [
-        [label_price, f"Rs. {data['price']:,.2f}"],
-        [label_down, f"Rs. {data['down']:,.2f}"],
-    ]
-    if (data.get("balance", 0.0) or 0.0) > 0.0:
-        bal_label = "Leasing Amount" if data.get("is_leasing") else "Balance"
-        pay.append([bal_label, f"Rs. {data['balance']:,.2f}"])
-    pt = Table(pay, colWidths=[200, 200])
-    pt.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (0,-1), colors.whitesmoke),
-        ("GRID", (0,0), (-1,-1), 0.25, colors.black),
-        ("FONTNAME", (0,0), (-1,-1), "Helvetica-Bold")
-    ]))
-    elements += [
-        Paragraph("<b>Payment Summary</b>", styles["Heading4"]),
-        Spacer(1, 8),
-        pt,
-        Spacer(1, 18)
-    ]
-
-    if data["delivery"]:
-        elements.append(
-            Paragraph(f"<b>Delivery Address:</b><br/>{data['delivery']}", styles["Normal"])
-        )
-        elements.append(Spacer(1, 20))
-
-    # Signature lines
-    elements.append(Spacer(1, 80))
-    sign = Table(
-        [
-            ["........................................", "........................................"],
-            ["Customer Signature", "Authorized Signature & Stamp"]
-        ],
-        colWidths=[240, 240],
-        hAlign="CENTER"
-    )
-    sign.setStyle(TableStyle([
-        ("ALIGN", (0,0), (-1,0), "CENTER"),
-        ("ALIGN", (0,1), (-1,1), "CENTER"),
-        ("FONTNAME", (0,1), (-1,1), "Helvetica-Bold")
-    ]))
-    elements += [KeepTogether(sign)]
-    elements.append(Spacer(1, 30))
-    elements.append(Paragraph("<para align='center'><b>Thank you for your business! Come again!</b></para>", styles["Normal"]))
-
-    def sales_footer(canvas, doc):
-        canvas.saveState()
-        x = doc.leftMargin + doc.width / 2.0
-        canvas.setFont("Helvetica", 9)
-        canvas.setFillColor(colors.gray)
-        canvas.drawCentredString(x, 25, "Contact: 0778525428 / 0768525428 | Email: gunawardhanaenttangalle@gmail.com")
-        canvas.restoreState()
-
-    doc.build(elements, onFirstPage=sales_footer, onLaterPages=sales_footer)
-
-
-
-def generate_proforma_pdf(data, out_path):
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-
-    styles = getSampleStyleSheet()
-    small = ParagraphStyle("small", parent=styles["Normal"], fontSize=9, leading=11)
-    title_style = ParagraphStyle("title", alignment=1, fontSize=16, fontName="Helvetica-Bold")
-
-    def header_footer(canvas, doc):
-        canvas.saveState()
-        try:
-            canvas.drawImage(resource_path("download.png"), 25, 790, width=50, height=50, preserveAspectRatio=True)
-        except Exception:
-            pass
-        dealer_name = str(data.get("dealer", "")).split(",")[0].strip() or "Dealer"
-        dealer_addr = ",".join(str(data.get("dealer", "")).split(",")[1:]).strip()
-        canvas.setFont("Helvetica-Bold", 12); canvas.setFillColor(colors.HexColor("#0B3D91"))
-        canvas.drawString(80, 820, dealer_name)
-        canvas.setFont("Helvetica", 9); canvas.setFillColor(colors.grey)
-        canvas.drawString(80, 805, "Authorized Dealer")
-        if dealer_addr:
-            canvas.setFont("Helvetica", 9); canvas.setFillColor(colors.black)
-            canvas.drawString(80, 792, dealer_addr)
-        try:
-            canvas.drawImage(resource_path("singer_logo.png"), 440, 805, width=120, height=35, preserveAspectRatio=True)
-        except Exception:
-            pass
-        canvas.setFont("Helvetica-Bold", 9)
-        canvas.drawCentredString(300, 45, dealer_name)
-        if dealer_addr:
-            canvas.setFont("Helvetica", 9)
-            canvas.drawCentredString(300, 32, dealer_addr)
-        canvas.setFont("Helvetica", 9)
-        canvas.drawCentredString(300, 20, "Contact: 0778525428 / 0768525428 | Email: gunawardhanaenttangalle@gmail.com")
-        canvas.restoreState()
-
-    doc = SimpleDocTemplate(out_path, pagesize=A4, rightMargin=25, leftMargin=25, topMargin=40, bottomMargin=30)
-    frame = Frame(25, 90, 545, 680, id="content")
-    doc.addPageTemplates([PageTemplate(id="main", frames=frame, onPage=header_footer)])
-
-    story = []
-    story.append(Spacer(1, 40))
-    story.append(Paragraph("PROFORMA INVOICE", title_style))
-    story.append(Spacer(1, 15))
-
-    top_col_widths = [190, 120, 80, 155]
-    recipient_block = (
-        f"TO : THE MANAGER\n{data['finance_company']}\n{data['finance_address']}\n\n"+
-        f"Customer: {data['customer']}\nAddress: {data['cust_addr']}\nNIC: {data['nic']}"
-    )
-    top_data = [
-        ["Proforma Invoice No.", data["invoice_no"], "DATE:", data["date"]],
-        [
-            "MANUFACTURER: INDIA\nPIAGGIO VEHICLES PVT LTD\nPUNE, MAHARASHTRA",
-            "",
-            recipient_block,
-            ""
-        ]
-    ]
-    top_table = Table(top_data, colWidths=top_col_widths)
-    top_table.setStyle(TableStyle([
-        ("SPAN", (0,1), (1,1)),
-        ("SPAN", (2,1), (3,1)),
-        ("BOX", (0,0), (-1,-1), 1, colors.black),
-        ("INNERGRID", (0,0), (-1,-1), 0.5, colors.black),
-        ("VALIGN", (0,0), (-1,-1), "TOP"),
-        ("FONTSIZE", (0,0), (-1,-1), 9),
-    ]))
-    story.append(top_table)
-    story.append(Spacer(1, 8))
-
-    desc_table = Table([
-        ["DESCRIPTION", "", "SELLING PRICE", f"{data['price']:,.2f}"],
-        ["MAKE", "PIAGGIO", "LEASE AMOUNT", f"{data['down']:,.2f}"],
-        ["MODEL", data["model"], "", ""],
-        ["COLOUR", data["color"], "", ""],
-        ["ENGINE NO", data["engine"], "", ""],
-        ["CHASSIS NO", data["chassis"], "", ""]
-    ], colWidths=[150, 200, 100, 95])
-    desc_table.setStyle(TableStyle([
-        ("BOX", (0,0), (-1,-1), 1, colors.black),
-        ("INNERGRID", (0,0), (-1,-1), 0.5, colors.black),
-        ("FONTSIZE", (0,0), (-1,-1), 9),
-        ("VALIGN", (0,0), (-1,-1), "TOP")
-    ]))
-    story.append(desc_table)
-    story.append(Spacer(1, 8))
-
-    info_table = Table([[
-        Paragraph("""
-BRAND NEW DIESEL THREE WHEELER<br/>
-12V Self-start, four stroke, air cooled diesel engine<br/>
-435CC 8h.p.<br/>
-Warranty : 18 months or 25,000kms whichever comes first<br/>
-Services : 3 labor-free services will be provided
-""", small),
-        Paragraph("""
-REMARKS:<br/>
-Please note that the above price offered is based on the prevailing
-rates of exchange, import duties, other Government levies and
-any variations to the above will be adjusted in the final invoice.
-""", small)
-    ]], colWidths=[270, 275])
-    info_table.setStyle(TableStyle([
-        ("BOX", (0,0), (-1,-1), 1, colors.black),
-        ("INNERGRID", (0,0), (-1,-1), 0.5, colors.black),
-        ("VALIGN", (0,0), (-1,-1), "TOP"),
-    ]))
-    story.append(info_table)
-    story.append(Spacer(1, 10))
-
-    story.append(Paragraph("""
-<b>VALIDITY – 07 DAYS</b><br/>
-PAYMENT TERMS: All payments should be made in favor of the finance company per instructions.<br/><br/>
-
-<b>DELIVERY – Within 14 to 30 DAYS</b><br/>
-1. Prices & Specifications subject to change without prior notice.<br/>
-2. Goods being quoted are subject to availability at time of confirmed order.<br/>
-3. Model of the vehicle must be mentioned clearly on your purchase order.<br/>
-4. Seller is not responsible for delays due to government regulations or force majeure.
-""", small))
-    story.append(Spacer(1, 90))
-    story.append(Paragraph(".......................................................<br/>Authorized Signatory", small))
-
-    doc.build(story)
+def invoice_pdf_path(invoice_type, year, data):
+    return os.path.join(app_dir(), "output", f"{invoice_type}-{year}",
+                        f"{data['invoice_no']}_{safe_filename(data['customer'])}.pdf")
 
 
 # ============================================================
@@ -470,18 +155,45 @@ class InvoiceApp:
 
         Button(master, text="Generate Invoice", width=25, command=self.generate_invoice).grid(row=row, column=1, pady=20)
         Button(master, text="Export All Invoices CSV", width=25, command=self.export_invoices_csv).grid(row=row, column=0, pady=20)
+        Button(master, text="Find Invoice", width=25, command=self.find_invoice).grid(row=row + 1, column=0)
+        Button(master, text="Print Run (Merge Day's PDFs)", width=25, command=self.print_run).grid(row=row + 2, column=0)
+
+        self.status_var = StringVar(value="")
+        Label(master, textvariable=self.status_var, fg="gray").grid(row=row + 3, column=0, columnspan=2, sticky=W)
+        self.progress = ttk.Progressbar(master, mode="indeterminate", length=200)
+        self.progress.grid(row=row + 1, column=1, pady=3)
+        self.progress.grid_remove()
+
+        self.api = InvoiceApiClient(API_BASE_URL, OFFLINE_QUEUE, on_synced=self.offline_synced,
+                                    on_rejected=self.offline_rejected) if API_BASE_URL else None
+        # One task thread: invoices queue up back to back and are numbered in click order.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="invoice-task")
+        self.tasks = []
+        self.busy = False
+        self.results = queue.Queue()
+        master.protocol("WM_DELETE_WINDOW", self.close)
+        self.update_status()
+        self.poll_results()
+        self.refresh_status()
 
     def generate_invoice(self):
         try:
             raw_type = self.invoice_var.get()
             invoice_type = "PROFORMA" if raw_type == "PROFORMA" else "SALES"
 
-            inv_no = next_invoice_number(invoice_type)
-
             def get(label):
                 w = self.entries[label]
                 return w.get("1.0", END).strip() if isinstance(w, Text) else w.get().strip()
 
+            if invoice_type == "SALES":
+                previous = store.chassis_invoiced(get("Chassis No:"), "SALES")
+                if previous and not messagebox.askyesno(
+                    "Chassis already invoiced",
+                    f"Chassis {previous['chassis']} was invoiced on {previous['date']} "
+                    f"({previous['invoice_type']} {previous['invoice_no']}, {previous['customer']}).\n\nCreate another invoice?"
+                ):
+                    return
+
             price = safe_float(get("Total Price (Rs):"))
             down = safe_float(get("Down Payment:"))
 
@@ -497,7 +209,7 @@ class InvoiceApp:
                 delivery = get("Delivery Address (Leasing):")
 
             data = {
-                "invoice_no": inv_no,
+                "invoice_no": "",
                 "date": self.date_entry.get().strip() or datetime.now().strftime("%Y-%m-%d"),
                 "dealer": get("Dealer Name:"),
                 "customer": get("Customer Name:"),
@@ -518,45 +230,198 @@ class InvoiceApp:
             }
 
             folder = os.path.join(app_dir(), "output", f"{invoice_type}-{datetime.now().year}")
-            out_path = os.path.join(folder, f"{inv_no}_{safe_filename(data['customer'])}.pdf")
-
-            if API_BASE_URL:
-                try:
-                    r = requests.post(f"{API_BASE_URL}/invoices/{raw_type}", json=data, timeout=25)
-                    r.raise_for_status()
-                    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-                    with open(out_path, "wb") as f:
-                        f.write(r.content)
-                except Exception:
-                    if invoice_type == "PROFORMA":
-                        generate_proforma_pdf(data, out_path)
-                    else:
-                        generate_sales_pdf(data, out_path)
-            else:
-                if invoice_type == "PROFORMA":
-                    generate_proforma_pdf(data, out_path)
-                else:
-                    generate_sales_pdf(data, out_path)
-            write_invoice_csv(invoice_type, data)
+            self.run_task(f"Invoice for {data['customer'] or 'customer'}", self.create_invoice,
+                          (raw_type, invoice_type, data, folder), self.invoice_created)
+
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed: {e}")
 
+    def create_invoice(self, raw_type, invoice_type, data, folder):
+        # Runs on the task thread: network, numbering, rendering and file writes.
+        pdf = None
+        key = uuid.uuid4().hex
+        if self.api:
+            # An error from the API propagates to task_done: only an API that
+            # cannot be reached may leave the numbering to this machine.
+            pdf = self.api.create(raw_type, data, key)
+        if pdf:
+            out_path = os.path.join(folder, f"{data['invoice_no']}_{safe_filename(data['customer'])}.pdf")
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            with open(out_path, "wb") as f:
+                f.write(pdf)
+        else:
+            # No API, or it could not be reached: number and render locally.
+            data["invoice_no"] = next_invoice_number(invoice_type)
+            out_path = os.path.join(folder, f"{data['invoice_no']}_{safe_filename(data['customer'])}.pdf")
+            os.makedirs(folder, exist_ok=True)
+            renderer.render(invoice_type, data, out_path)
+            if self.api:
+                # Recorded once the server has numbered it, see offline_synced.
+                self.api.queue_offline(raw_type, datetime.now().year, data, key)
+                return out_path, True
+        write_invoice_csv(invoice_type, data)
+        return out_path, False
+
+    def offline_synced(self, raw_type, year, data, invoice_no):
+        # Runs on the sync thread: the server numbered an offline invoice,
+        # usually differently, so the PDF is rendered again under its number.
+        invoice_type = "PROFORMA" if raw_type == "PROFORMA" else "SALES"
+        local_no = data["invoice_no"]
+        local_path = invoice_pdf_path(invoice_type, year, data)
+        data = dict(data, invoice_no=invoice_no)
+        if not store.get(invoice_no, invoice_type, year):
+            write_invoice_csv(invoice_type, data, year)
+        if invoice_no != local_no:
+            out_path = invoice_pdf_path(invoice_type, year, data)
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            renderer.render(invoice_type, data, out_path)
+            if os.path.exists(local_path):
+                os.remove(local_path)
+            self.results.put((messagebox.showinfo, (
+                "Offline invoice synced",
+                f"Invoice {local_no} for {data['customer'] or 'customer'} is registered on the server "
+                f"as {invoice_type} {invoice_no}:\n{out_path}",
+            )))
+        self.results.put((self.update_status, ()))
+
+    def offline_rejected(self, raw_type, year, data, reason):
+        # Runs on the sync thread: the server refused an offline invoice for
+        # good, so it was moved out of the queue and is not registered.
+        self.results.put((messagebox.showwarning, (
+            "Offline invoice rejected",
+            f"Invoice {data.get('invoice_no', '')} for {data.get('customer') or 'customer'} was rejected by the server "
+            f"and is not registered:\n{reason}\n\nIts details were saved to {self.api.rejected_path}.",
+        )))
+        self.results.put((self.update_status, ()))
+
+    def invoice_created(self, result):
+        out_path, offline = result
+        if offline:
+            messagebox.showinfo("Saved offline", f"Server unreachable, invoice generated locally and queued for sync:\n{out_path}\n\n"
+                                "The server assigns its final number when it syncs.")
+        else:
             messagebox.showinfo("Success", f"Invoice generated:\n{out_path}")
 
+    def run_task(self, label, fn, args, on_done):
+        """Run ``fn(*args)`` on the task thread; ``on_done(result)`` runs on the Tk thread."""
+        future = self.executor.submit(fn, *args)
+        self.tasks.append(label)
+        self.update_status()
+        future.add_done_callback(lambda f: self.results.put((self.task_done, (label, f, on_done))))
+
+    def task_done(self, label, future, on_done):
+        self.tasks.remove(label)
+        self.update_status()
+        try:
+            result = future.result()
         except Exception as e:
-            messagebox.showerror("Error", f"Failed: {e}")
+            messagebox.showerror("Error", f"{label} failed: {e}")
+            return
+        on_done(result)
+
+    def poll_results(self):
+        try:
+            while True:
+                callback, args = self.results.get_nowait()
+                callback(*args)
+        except queue.Empty:
+            pass
+        self.master.after(100, self.poll_results)
+
+    def refresh_status(self):
+        # The sync thread fails and backs off without posting anything.
+        if not self.tasks:
+            self.update_status()
+        self.master.after(5000, self.refresh_status)
+
+    def update_status(self):
+        if self.tasks:
+            more = f" (+{len(self.tasks) - 1} queued)" if len(self.tasks) > 1 else ""
+            self.status_var.set(f"Working: {self.tasks[0]}{more}")
+            if not self.busy:
+                self.busy = True
+                self.progress.grid()
+                self.progress.start(10)
+        else:
+            self.busy = False
+            self.progress.stop()
+            self.progress.grid_remove()
+            self.status_var.set(self.offline_status() if self.api else "")
+
+    def offline_status(self):
+        status = []
+        pending = self.api.pending_offline()
+        if pending:
+            failing = ", sync failing, retrying" if self.api.sync_failing() else ""
+            status.append(f"{pending} offline invoice(s) waiting to sync with the server{failing}")
+        if self.api.rejected:
+            status.append(f"{self.api.rejected} rejected by the server, see {os.path.basename(self.api.rejected_path)}")
+        if self.api.offline.skipped:
+            status.append(f"{self.api.offline.skipped} unreadable offline record(s) skipped, see {os.path.basename(APP_LOG)}")
+        return "; ".join(status)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.api:
+            self.api.close()
+        self.master.destroy()
+
+    def find_invoice(self):
+        value = simpledialog.askstring("Find Invoice", "Invoice no, NIC, chassis or engine:", parent=self.master)
+        if not value or not value.strip():
+            return
+        rows = []
+        for field in ("invoice_no", "nic", "chassis", "engine"):
+            rows += store.find(field, value, limit=20)
+        if not rows:
+            messagebox.showinfo("Find Invoice", "No matching invoices.")
+            return
+        lines = [f"{r['invoice_type']} {r['invoice_no']}  {r['date']}  {r['customer']}  {r['chassis']}" for r in rows[:20]]
+        messagebox.showinfo("Find Invoice", "\n".join(lines))
 
     def export_invoices_csv(self):
-        if not os.path.exists(INVOICES_CSV):
+        if store.is_empty():
             messagebox.showinfo("No data", "No invoices to export yet.")
             return
         export_dir = os.path.join(app_dir(), "output", "exports")
         os.makedirs(export_dir, exist_ok=True)
         dest = os.path.join(export_dir, f"invoices_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
-        with open(INVOICES_CSV, "r", encoding="utf-8") as fi, open(dest, "w", encoding="utf-8", newline="") as fo:
-            fo.write(fi.read())
-        messagebox.showinfo("Exported", f"CSV exported:\n{dest}")
+        self.run_task("CSV export", export.to_file, (store, dest, "csv"),
+                      lambda _: messagebox.showinfo("Exported", f"CSV exported:\n{dest}"))
 
+    def print_run(self):
+        day = simpledialog.askstring("Print Run", "Merge the invoices of date (YYYY-MM-DD):",
+                                     initialvalue=datetime.now().strftime("%Y-%m-%d"), parent=self.master)
+        if not day or not day.strip():
+            return
+        day = day.strip()
+        dest = os.path.join(app_dir(), "output", "print-runs", printrun.filename(day))
+        self.run_task(f"Print run {day}", self.build_print_run, (day, dest), self.print_run_done)
+
+    def build_print_run(self, day, dest):
+        # The PDFs saved in output/{type}-{year}/, merged in the order they were issued.
+        rows = sorted(store.iter_search(date_from=day, date_to=day), key=lambda r: r["id"])
+        paths, missing = [], 0
+        for r in rows:
+            path = invoice_pdf_path(r["invoice_type"], r["year"], r)
+            if os.path.exists(path):
+                paths.append(path)
+            else:
+                missing += 1
+        if not paths:
+            raise ValueError(f"no saved invoices dated {day}")
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        printrun.merge(paths, dest)
+        return dest, len(paths), missing
+
+    def print_run_done(self, result):
+        dest, merged, missing = result
+        note = f"\n\n{missing} invoice(s) of that day have no saved PDF and were left out." if missing else ""
+        messagebox.showinfo("Print Run", f"Merged {merged} invoice(s):\n{dest}{note}")
 
 if __name__ == "__main__":
+    logging.basicConfig(filename=APP_LOG, level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     root = Tk()
     app = InvoiceApp(root)
     root.mainloop()
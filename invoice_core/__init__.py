@@ -0,0 +1 @@
+"""Shared invoice logic used by the API, the Streamlit app and the desktop app."""
@@ -0,0 +1,180 @@
+"""Admission control for invoice rendering.
+
+``RateLimiter`` gives every client (an API key or an address) a token bucket:
+``rate`` requests per second on average, with bursts of up to ``burst``.
+A request may cost more than one token (a batch costs one per invoice);
+one dearer than the whole burst is let through from a full bucket and
+leaves it in debt, so the client waits until the rate has paid it back.
+``RenderQueue`` bounds the renders in flight and hands free slots to the
+waiting requests by priority, then arrival, so an interactive invoice
+overtakes batch work that queued before it. A request that would wait
+behind ``max_waiting`` others of its own priority or higher is refused
+rather than queued. Both refuse with ``Rejected``, which carries how long
+the caller should wait before retrying.
+
+With a ``path`` the rate limiter keeps its buckets in SQLite, so every API
+worker process on the host spends from the same bucket and a client gets
+the configured rate however many workers uvicorn runs. The render queue
+stays in each process on purpose: it bounds the renders that process has in
+flight. Neither is shared between hosts, and serverless instances (the
+Vercel deployment) each have their own file system, so there the limits
+apply per instance and N warm instances admit up to N times the rate.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    client TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    stamp REAL NOT NULL
+);
+"""
+from contextlib import asynccontextmanager
+
+INTERACTIVE, BATCH = 0, 1
+
+
+class Rejected(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def header(self):
+        """``retry_after`` as a Retry-After value: whole seconds, at least 1."""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class RateLimiter:
+    def __init__(self, rate, burst, max_clients=10000, path=None):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self.path = path
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if path:
+            with self._connect() as conn:
+                conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _spend(self, bucket, now, cost):
+        """Tokens left once ``cost`` is spent from ``bucket`` (tokens, stamp), or raise Rejected."""
+        tokens, stamp = bucket
+        tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+        needed = min(cost, self.burst)
+        if tokens < needed:
+            raise Rejected(f"Rate limit of {self.rate:g} requests per second exceeded",
+                           (needed - tokens) / self.rate)
+        return tokens - cost
+
+    def take(self, client, cost=1):
+        """Spend ``cost`` tokens from ``client``'s bucket, or raise Rejected. A rate of 0 admits everything."""
+        if not self.rate:
+            return
+        if self.path:
+            return self._take_shared(client, cost)
+        now = time.monotonic()
+        with self._lock:
+            self._buckets[client] = (self._spend(self._buckets.get(client, (self.burst, now)), now, cost), now)
+            if len(self._buckets) > self.max_clients:
+                # A bucket that has refilled since is the same as no bucket.
+                self._buckets = {k: v for k, v in self._buckets.items()
+                                 if v[0] + (now - v[1]) * self.rate < self.burst}
+
+    def _take_shared(self, client, cost):
+        # Wall-clock time: the stamps are compared across processes.
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, stamp FROM rate_buckets WHERE client = ?", (client,)).fetchone()
+            left = self._spend(row or (self.burst, now), now, cost)
+            conn.execute("INSERT OR REPLACE INTO rate_buckets (client, tokens, stamp) VALUES (?, ?, ?)",
+                         (client, left, now))
+            if row is None:
+                conn.execute("DELETE FROM rate_buckets WHERE tokens + (? - stamp) * ? >= ?",
+                             (now, self.rate, self.burst))
+
+
+class RenderQueue:
+    """Priority semaphore for the event loop; lower priority numbers go first."""
+
+    def __init__(self, slots, max_waiting, service_time=0.25):
+        self.slots = slots
+        self.max_waiting = max_waiting
+        # Moving average of how long a slot is held, for Retry-After.
+        self.service_time = service_time
+        self.busy = 0
+        self._waiters = []
+        self._order = itertools.count()
+
+    def waiting(self, priority=BATCH):
+        """Requests waiting with ``priority`` or a more urgent one."""
+        return sum(1 for p, _, f in self._waiters if p <= priority and not f.done())
+
+    def retry_after(self, ahead):
+        return (ahead + 1) * self.service_time / self.slots
+
+    def check(self, priority=INTERACTIVE):
+        """Raise Rejected if a request of ``priority`` would find the queue full."""
+        if self.busy >= self.slots:
+            ahead = self.waiting(priority)
+            if ahead >= self.max_waiting:
+                raise Rejected("Render queue is full", self.retry_after(ahead))
+
+    async def acquire(self, priority=INTERACTIVE, bounded=True):
+        """Wait for a slot; returns the time it was granted, for ``release``.
+
+        With ``bounded`` a full queue raises Rejected instead of waiting.
+        """
+        if bounded:
+            self.check(priority)
+        if self.busy < self.slots:
+            # Slots are handed straight to waiters, so a free one means nobody waits.
+            self.busy += 1
+            return time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._hand_off()
+            raise
+        return time.perf_counter()
+
+    def release(self, granted=None):
+        if granted is not None:
+            self.service_time += 0.2 * (time.perf_counter() - granted - self.service_time)
+        self._hand_off()
+
+    def _hand_off(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.busy -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority=INTERACTIVE, bounded=True):
+        granted = await self.acquire(priority, bounded)
+        try:
+            yield
+        finally:
+            self.release(granted)
@@ -0,0 +1,218 @@
+"""Columnar snapshot of the invoice store for sales reporting.
+
+Each reporting column lives in its own flat binary file (little-endian,
+fixed width) that only ever grows: the day as yyyymmdd, price, down and
+balance as float64, and model, dealer, payment method and invoice type as
+int32 codes into per-column dictionaries. ``refresh`` appends the store rows
+added since the last refresh, so keeping the snapshot current costs one
+indexed query and a few small appends per invoice. Aggregations load the
+columns as NumPy arrays and sum each group with ``bincount`` in a single
+pass, never touching the text of the rows. Appends use the standard
+``array`` module, so NumPy is only imported by the first report.
+
+The store row id is the high-water mark, so an invoice rewritten in place
+keeps its original figures here until ``rebuild``.
+"""
+import json
+import os
+import sys
+from array import array
+
+from .sequence import file_lock
+
+NUMERIC = ("price", "down", "balance")
+CATEGORIES = ("model", "dealer", "payment_method", "invoice_type")
+GROUPS = ("month", "year") + CATEGORIES
+DTYPES = dict(
+    {"id": "<i8", "day": "<i4"},
+    **{c: "<f8" for c in NUMERIC},
+    **{c: "<i4" for c in CATEGORIES},
+)
+# array typecodes of the same width as each dtype.
+TYPECODES = {"<i8": "q", "<i4": "i", "<f8": "d"}
+
+
+def _itemsize(dtype):
+    return int(dtype[2:])
+
+
+def _pack(values, dtype):
+    a = array(TYPECODES[dtype], values)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tobytes()
+
+
+def _day(date):
+    try:
+        return int(str(date)[:10].replace("-", ""))
+    except ValueError:
+        return 0
+
+
+class InvoiceSnapshot:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = os.path.join(path, "lock")
+        self._meta = {"rows": 0, "last_id": 0}
+        self._dicts = {c: [] for c in CATEGORIES}
+        self._columns = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name + ".bin")
+
+    def _repair(self):
+        # Drop anything a failed refresh appended past the committed row count.
+        for name, dtype in DTYPES.items():
+            col = self._file(name)
+            if os.path.exists(col) and os.path.getsize(col) > self._meta["rows"] * _itemsize(dtype):
+                with open(col, "r+b") as f:
+                    f.truncate(self._meta["rows"] * _itemsize(dtype))
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.path, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self._meta = {"rows": meta["rows"], "last_id": meta["last_id"]}
+            self._dicts = {c: meta["dicts"][c] for c in CATEGORIES}
+        except (OSError, ValueError, KeyError):
+            self._meta = {"rows": 0, "last_id": 0}
+            self._dicts = {c: [] for c in CATEGORIES}
+
+    def _write_meta(self):
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dict(self._meta, dicts=self._dicts), f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def refresh(self, store, batch_size=10000):
+        """Append store rows added since the last refresh; returns how many."""
+        added = 0
+        with file_lock(self._lock):
+            self._read_meta()
+            self._repair()
+            conn = store._connect()
+            while True:
+                rows = conn.execute(
+                    "SELECT id, date, price, down, balance, " + ", ".join(CATEGORIES)
+                    + " FROM invoices WHERE id > ? ORDER BY id LIMIT ?",
+                    (self._meta["last_id"], batch_size),
+                ).fetchall()
+                if not rows:
+                    break
+                codes = {c: {v: i for i, v in enumerate(self._dicts[c])} for c in CATEGORIES}
+                cols = {
+                    "id": [r["id"] for r in rows],
+                    "day": [_day(r["date"]) for r in rows],
+                }
+                for c in NUMERIC:
+                    cols[c] = [r[c] for r in rows]
+                for c in CATEGORIES:
+                    values = []
+                    for r in rows:
+                        v = r[c] or ""
+                        if v not in codes[c]:
+                            codes[c][v] = len(self._dicts[c])
+                            self._dicts[c].append(v)
+                        values.append(codes[c][v])
+                    cols[c] = values
+                for name, dtype in DTYPES.items():
+                    with open(self._file(name), "ab") as f:
+                        f.write(_pack(cols[name], dtype))
+                self._meta["rows"] += len(rows)
+                self._meta["last_id"] = rows[-1]["id"]
+                self._write_meta()
+                added += len(rows)
+        return added
+
+    def rebuild(self, store):
+        """Discard the snapshot and rebuild it from the whole store."""
+        with file_lock(self._lock):
+            for name in DTYPES:
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._meta = {"rows": 0, "last_id": 0}
+            self._dicts = {c: [] for c in CATEGORIES}
+            self._write_meta()
+        self._columns = None
+        return self.refresh(store)
+
+    def columns(self):
+        """The snapshot as a dict of NumPy arrays, reloaded only when it grew."""
+        import numpy as np
+        with file_lock(self._lock):
+            self._read_meta()
+            rows = self._meta["rows"]
+            if self._columns is None or self._columns[0] != rows:
+                cols = {}
+                for name, dtype in DTYPES.items():
+                    cols[name] = np.fromfile(self._file(name), dtype=dtype, count=rows) if rows else np.empty(0, dtype)
+                self._columns = (rows, cols, {c: list(self._dicts[c]) for c in CATEGORIES})
+        return self._columns[1], self._columns[2]
+
+    def summary(self, group_by=("month",), year=None, date_from=None, date_to=None):
+        """Count and sum of price, down and balance per group, sorted by group."""
+        for g in group_by:
+            if g not in GROUPS:
+                raise ValueError(f"Cannot group by {g}; choose from {', '.join(GROUPS)}")
+        import numpy as np
+        cols, dicts = self.columns()
+        mask = np.ones(len(cols["day"]), dtype=bool)
+        if year:
+            mask &= cols["day"] // 10000 == int(year)
+        if date_from:
+            mask &= cols["day"] >= _day(date_from)
+        if date_to:
+            mask &= cols["day"] <= _day(date_to)
+        day = cols["day"][mask]
+
+        # Each group column becomes a dense code with a known range, so the
+        # groups are mixed-radix numbers and bincount can sum them in one pass.
+        key = np.zeros(len(day), dtype=np.int64)
+        decoders = []
+        for g in group_by:
+            if g in ("month", "year"):
+                v = day // 100 if g == "month" else day // 10000
+                if g == "month":
+                    v = (v // 100) * 12 + v % 100 - 1
+                lo = int(v.min()) if len(v) else 0
+                codes, radix = v - lo, (int(v.max()) - lo + 1 if len(v) else 1)
+            else:
+                codes, radix = cols[g][mask], max(len(dicts[g]), 1)
+                lo = 0
+            key = key * radix + codes
+            decoders.append((g, radix, lo))
+        size = 1
+        for _, radix, _ in decoders:
+            size *= radix
+        weights = {c: cols[c][mask] for c in NUMERIC}
+        if size <= 4 * len(day) + 1024:
+            counts = np.bincount(key, minlength=size)
+            sums = {c: np.bincount(key, weights=w, minlength=size) for c, w in weights.items()}
+            groups = np.flatnonzero(counts) if group_by else np.zeros(1, dtype=np.int64)
+            counts = counts[groups]
+            sums = {c: v[groups] for c, v in sums.items()}
+        else:
+            groups, index = np.unique(key, return_inverse=True)
+            counts = np.bincount(index, minlength=len(groups))
+            sums = {c: np.bincount(index, weights=w, minlength=len(groups)) for c, w in weights.items()}
+
+        result = []
+        for i, k in enumerate(groups.tolist()):
+            row = {}
+            for g, radix, lo in reversed(decoders):
+                k, v = divmod(k, radix)
+                v += lo
+                if g == "month":
+                    row[g] = f"{v // 12:04d}-{v % 12 + 1:02d}"
+                elif g == "year":
+                    row[g] = v
+                else:
+                    row[g] = dicts[g][v]
+            row = {g: row[g] for g in group_by}
+            row["count"] = int(counts[i])
+            for c in NUMERIC:
+                row[c] = round(float(sums[c][i]), 2)
+            result.append(row)
+        return result
@@ -0,0 +1,173 @@
+"""HTTP client for the invoice API.
+
+Requests share one pooled keep-alive ``requests.Session``; callers run them
+off their UI thread. Invoices created while the API is unreachable are
+numbered locally and journalled in an ``Outbox``; its flusher thread posts
+them to ``/invoices/sync`` in batches, backing off while the API stays down.
+The API numbers each synced invoice again from its own sequence and
+``on_synced`` is called with the number it was given.
+
+A record the API refuses for good (a 4xx other than 408, 409 or 429) is
+moved to ``<outbox>.rejected.csv`` with the reason and ``on_rejected`` is
+called, so it does not hold up the records queued after it. Connection
+errors and other responses leave the batch in the outbox to be retried.
+
+Only a failure to reach the API sends an invoice down the offline path. An
+API that answers with an error raises ``ApiError``, since numbering that
+invoice locally would create it a second time.
+"""
+import csv
+import json
+import logging
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .outbox import Outbox
+
+logger = logging.getLogger(__name__)
+
+
+REJECT_COLUMNS = ["rejected_at", "reason", "invoice_type", "year", "invoice_no", "idempotency_key", "data"]
+# Refusals that may go away if the same request is sent again later.
+RETRY_STATUS = (408, 409, 429)
+
+
+class ApiError(Exception):
+    """The API answered the request with an error."""
+
+
+def _error(r):
+    try:
+        detail = r.json().get("detail", r.text)
+    except ValueError:
+        detail = r.text
+    return ApiError(f"Invoice API returned {r.status_code}: {str(detail)[:200]}")
+
+
+class InvoiceApiClient:
+    def __init__(self, base_url, outbox_path, timeout=25, retries=3, on_synced=None, on_rejected=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        # on_synced(invoice_type, year, data, invoice_no): ``data`` still has the local number.
+        self.on_synced = on_synced
+        # on_rejected(invoice_type, year, data, reason): the API refused the invoice for good.
+        self.on_rejected = on_rejected
+        self.rejected_path = outbox_path + ".rejected.csv"
+        self.rejected = 0
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.offline = Outbox(outbox_path, {"api": self._sync}, batch_size=100, interval=30.0, max_backoff=300.0)
+        self.offline.start()
+
+    def queue_offline(self, raw_type, year, data, key=None):
+        """Journal a locally numbered invoice for the next sync.
+
+        ``key`` is the Idempotency-Key ``create`` tried with, so an attempt
+        that reached the API after all is not created twice.
+        """
+        self.offline.append(raw_type, year, dict(data, idempotency_key=key) if key else data)
+
+    def pending_offline(self):
+        """Number of offline invoices not yet synced."""
+        return self.offline.pending_records()
+
+    def sync_failing(self):
+        """True while the last sync attempt failed and the outbox is backing off."""
+        return bool(self.offline.failing())
+
+    def close(self):
+        self.offline.stop()
+        self.session.close()
+
+    def create(self, raw_type, data, key=None):
+        """POST one invoice; returns the PDF, or None if the API could not be reached.
+
+        Every attempt carries the same Idempotency-Key (``key``, or a new
+        one), so a retry after a timeout gets back the invoice the first
+        attempt created. A 409 or 429 is retried after its Retry-After; if
+        the retries run out on one, or the API answers with any other error,
+        ApiError is raised.
+        """
+        headers = {"Idempotency-Key": key or uuid.uuid4().hex}
+        refused = None
+        for attempt in range(self.retries):
+            try:
+                r = self.session.post(f"{self.base_url}/invoices/{raw_type}", json=data, headers=headers, timeout=self.timeout)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                logger.warning("Invoice API attempt %d failed: %s", attempt + 1, e)
+                continue
+            if r.status_code in (409, 429):
+                # Still in progress, or the API asks us to slow down.
+                refused = r
+                time.sleep(float(r.headers.get("Retry-After", "1")))
+                continue
+            if not r.ok:
+                raise _error(r)
+            data["invoice_no"] = r.headers.get("X-Invoice-No", data["invoice_no"])
+            return r.content
+        if refused is not None:
+            raise _error(refused)
+        return None
+
+    def _sync(self, records):
+        body = []
+        for rec in records:
+            data = dict(rec["data"])
+            key = data.pop("idempotency_key", None)
+            body.append({"invoice_type": rec["invoice_type"], "year": rec["year"], "data": data, "idempotency_key": key})
+        r = self._post_sync(body)
+        if r.ok:
+            self._synced(body, r.json()["invoices"])
+        elif len(body) == 1:
+            self._reject(body[0], r)
+        else:
+            # The API refuses the whole batch over one bad record: send them
+            # one at a time so only that one is rejected. Each carries its
+            # Idempotency-Key, so if this stops part way and the batch is
+            # retried, the ones already synced are not created twice.
+            for sent in body:
+                r = self._post_sync([sent])
+                if r.ok:
+                    self._synced([sent], r.json()["invoices"])
+                else:
+                    self._reject(sent, r)
+
+    def _post_sync(self, body):
+        """POST to /invoices/sync; raises unless it succeeds or is refused for good."""
+        r = self.session.post(f"{self.base_url}/invoices/sync", json=body, timeout=self.timeout)
+        if r.ok or (400 <= r.status_code < 500 and r.status_code not in RETRY_STATUS):
+            return r
+        raise _error(r)
+
+    def _synced(self, body, invoices):
+        if self.on_synced is None:
+            return
+        for sent, synced in zip(body, invoices):
+            try:
+                self.on_synced(sent["invoice_type"], synced["year"], sent["data"], synced["invoice_no"])
+            except Exception:
+                logger.exception("Recording synced invoice %s failed", synced["invoice_no"])
+
+    def _reject(self, sent, r):
+        reason = str(_error(r))
+        data = sent["data"]
+        with open(self.rejected_path, "a", newline="", encoding="utf-8") as f:
+            rejects = csv.writer(f)
+            if f.tell() == 0:
+                rejects.writerow(REJECT_COLUMNS)
+            rejects.writerow([time.strftime("%Y-%m-%d %H:%M:%S"), reason, sent["invoice_type"], sent["year"],
+                              data.get("invoice_no", ""), sent["idempotency_key"] or "", json.dumps(data)])
+        self.rejected += 1
+        logger.error("Offline invoice %s rejected, moved to %s: %s", data.get("invoice_no", ""), self.rejected_path, reason)
+        if self.on_rejected is None:
+            return
+        try:
+            self.on_rejected(sent["invoice_type"], sent["year"], data, reason)
+        except Exception:
+            logger.exception("Reporting rejected invoice %s failed", data.get("invoice_no", ""))
@@ -0,0 +1,64 @@
+"""Streaming invoice export.
+
+``stream`` walks the store a page at a time and yields the encoded output in
+fixed-size chunks, so an export of the whole history uses the same memory as
+an export of one day. Both formats carry the store's ``COLUMNS``.
+"""
+import csv
+import io
+import json
+import zlib
+
+from .store import COLUMNS
+
+CHUNK_SIZE = 64 * 1024
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+
+def _encoded(store, fmt, filters):
+    if fmt == "csv":
+        buf = io.StringIO()
+        w = csv.writer(buf)
+        w.writerow(COLUMNS)
+        for row in store.iter_search(**filters):
+            w.writerow([row[c] for c in COLUMNS])
+            if buf.tell() >= CHUNK_SIZE:
+                yield buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue().encode("utf-8")
+    elif fmt == "ndjson":
+        for row in store.iter_search(**filters):
+            yield json.dumps({c: row[c] for c in COLUMNS}, ensure_ascii=False).encode("utf-8") + b"\n"
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+
+def stream(store, fmt="csv", compress=False, chunk_size=CHUNK_SIZE, **filters):
+    """Yield the export as ``chunk_size`` byte chunks (the last may be shorter)."""
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending = bytearray()
+    for data in _encoded(store, fmt, filters):
+        pending += gz.compress(data) if gz else data
+        while len(pending) >= chunk_size:
+            yield bytes(pending[:chunk_size])
+            del pending[:chunk_size]
+    if gz:
+        pending += gz.flush()
+    while pending:
+        yield bytes(pending[:chunk_size])
+        del pending[:chunk_size]
+
+
+def filename(fmt, compress, stamp):
+    name = f"invoices_{stamp}.{FORMATS[fmt][1]}"
+    return name + ".gz" if compress else name
+
+
+def to_file(store, path, fmt="csv", compress=False, **filters):
+    with open(path, "wb") as f:
+        for chunk in stream(store, fmt, compress, **filters):
+            f.write(chunk)
@@ -0,0 +1,116 @@
+"""Idempotency keys for invoice creation.
+
+A client sends the same ``Idempotency-Key`` when it retries a request. The
+first request claims the key; once its invoice is numbered and rendered the
+key records which invoice it produced, and any retry is answered with that
+invoice instead of allocating a new number. Keys expire after ``ttl``
+seconds and at most ``max_keys`` are kept, oldest dropped first. State lives
+in SQLite so every API worker process sees the same keys.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    created REAL NOT NULL,
+    invoice_type TEXT,
+    year INTEGER,
+    invoice_no TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idempotency_keys_created ON idempotency_keys (created);
+"""
+
+MAX_KEY_LENGTH = 255
+
+
+class KeyInProgress(Exception):
+    """Another request with this key has not finished yet."""
+
+
+class KeyReused(Exception):
+    """The key was already used for a different request body."""
+
+
+def fingerprint(*parts):
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, path, ttl=24 * 3600, max_keys=10000, pending_timeout=120):
+        self.path = path
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.pending_timeout = pending_timeout
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def claim(self, key, fp):
+        """Claim ``key`` for a new request.
+
+        Returns None if the caller should go ahead and create the invoice, or
+        the (invoice_type, year, invoice_no, data) a previous request with the
+        same key created. Raises KeyInProgress or KeyReused otherwise.
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise ValueError(f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM idempotency_keys WHERE created < ?", (now - self.ttl,))
+            row = conn.execute(
+                "SELECT fingerprint, created, invoice_type, year, invoice_no, data FROM idempotency_keys WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO idempotency_keys (key, fingerprint, created) VALUES (?, ?, ?)",
+                    (key, fp, now),
+                )
+                conn.execute(
+                    "DELETE FROM idempotency_keys WHERE key IN ("
+                    "SELECT key FROM idempotency_keys ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                    (self.max_keys,),
+                )
+                return None
+            stored_fp, created, invoice_type, year, invoice_no, data = row
+            if stored_fp != fp:
+                raise KeyReused("Idempotency-Key was already used with a different request")
+            if invoice_no is not None:
+                return invoice_type, year, invoice_no, json.loads(data)
+            if now - created < self.pending_timeout:
+                raise KeyInProgress("A request with this Idempotency-Key is still in progress")
+            # The first request died without finishing; let this one take over.
+            conn.execute("UPDATE idempotency_keys SET created = ? WHERE key = ?", (now, key))
+            return None
+
+    def complete(self, key, invoice_type, year, invoice_no, data):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE idempotency_keys SET invoice_type = ?, year = ?, invoice_no = ?, data = ? WHERE key = ?",
+                (invoice_type, year, invoice_no, json.dumps(data, default=str), key),
+            )
+
+    def release(self, key):
+        """Forget a claim whose request failed, so the client can retry it."""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM idempotency_keys WHERE key = ? AND invoice_no IS NULL", (key,))
@@ -0,0 +1,208 @@
+"""Write-behind queue for invoice records.
+
+``Outbox.append`` is the only work on the request path: one JSON line
+appended to a local journal and fsync'd. A background thread replays the
+journal into each sink (Supabase, invoices.csv, ...) in batches. Every sink
+has its own checkpoint, so a failing sink is retried with backoff without
+holding back the others, and nothing is lost if the process dies: on restart
+the unflushed tail is replayed. Sinks must therefore be idempotent on the
+invoice key. Once every sink has caught up the journal is truncated.
+
+Failures are logged to the ``invoice_core.outbox`` logger; ``failing()``,
+``skipped`` and ``pending_records()`` let an app show them to its user.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+from .sequence import file_lock
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox:
+    def __init__(self, path, sinks, batch_size=200, interval=1.0, max_backoff=60.0):
+        self.path = path
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.offsets_path = path + ".offsets"
+        self.append_lock = path + ".lock"
+        self.flush_lock = path + ".flush.lock"
+        self._failures = {name: 0 for name in sinks}
+        self._retry_at = {name: 0.0 for name in sinks}
+        # Unreadable lines: byte offsets in the current journal, and a running total.
+        self._unreadable = set()
+        self.skipped = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def append(self, invoice_type, year, data):
+        self.append_many([(invoice_type, year, data)])
+
+    def append_many(self, entries):
+        """Journal several (invoice_type, year, data) records with one fsync."""
+        payload = b"".join(
+            json.dumps({"invoice_type": t, "year": y, "data": d}, separators=(",", ":")).encode("utf-8") + b"\n"
+            for t, y, d in entries
+        )
+        with file_lock(self.append_lock):
+            with open(self.path, "ab") as fh:
+                fh.write(payload)
+                fh.flush()
+                os.fsync(fh.fileno())
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="invoice-outbox", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Stop the flusher after one last flush attempt."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def pending(self):
+        """Number of journal bytes not yet flushed to every sink."""
+        if not os.path.exists(self.path):
+            return 0
+        offsets = self._load_offsets()
+        size = os.path.getsize(self.path)
+        return max(size - offsets.get(name, 0) for name in self.sinks) if self.sinks else 0
+
+    def pending_records(self):
+        """Number of journalled records not yet flushed to every sink."""
+        if not self.sinks or not os.path.exists(self.path):
+            return 0
+        offsets = self._load_offsets()
+        with open(self.path, "rb") as fh:
+            fh.seek(min(offsets.get(name, 0) for name in self.sinks))
+            return sum(chunk.count(b"\n") for chunk in iter(lambda: fh.read(65536), b""))
+
+    def failing(self):
+        """Names of the sinks whose last flush failed and are backing off."""
+        return [name for name, failures in self._failures.items() if failures]
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Outbox flush of %s failed", self.path)
+            if self._stop.is_set():
+                return
+
+    def flush(self):
+        """Push pending records to every sink that is not backing off."""
+        if not os.path.exists(self.path):
+            return
+        with file_lock(self.flush_lock):
+            offsets = self._load_offsets()
+            for name, sink in self.sinks.items():
+                if time.monotonic() < self._retry_at[name]:
+                    continue
+                offset = offsets.get(name, 0)
+                while True:
+                    records, end = self._read(offset)
+                    if end == offset:
+                        break
+                    try:
+                        if records:
+                            sink(records)
+                    except Exception as e:
+                        self._failures[name] += 1
+                        delay = min(self.max_backoff, 2 ** (self._failures[name] - 1))
+                        self._retry_at[name] = time.monotonic() + delay
+                        logger.warning("Outbox sink %s failed (%d records), retrying in %.0fs: %s",
+                                       name, len(records), delay, e)
+                        break
+                    self._failures[name] = 0
+                    offset = offsets[name] = end
+                    self._save_offsets(offsets)
+            self._truncate_if_drained(offsets)
+
+    def _read(self, offset):
+        records = []
+        with open(self.path, "rb") as fh:
+            fh.seek(offset)
+            end = offset
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    break
+                end += len(line)
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    start = end - len(line)
+                    if start not in self._unreadable:
+                        self._unreadable.add(start)
+                        self.skipped += 1
+                        logger.error("Outbox skipping unreadable record at byte %d of %s: %r",
+                                     start, self.path, line[:200])
+                if len(records) >= self.batch_size:
+                    break
+        return records, end
+
+    def _truncate_if_drained(self, offsets):
+        with file_lock(self.append_lock):
+            size = os.path.getsize(self.path)
+            if size and all(offsets.get(name, 0) >= size for name in self.sinks):
+                with open(self.path, "r+b") as fh:
+                    fh.truncate(0)
+                self._save_offsets({name: 0 for name in self.sinks})
+                self._unreadable.clear()
+
+    def _load_offsets(self):
+        try:
+            with open(self.offsets_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_offsets(self, offsets):
+        tmp = self.offsets_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(offsets, f)
+        os.replace(tmp, self.offsets_path)
+
+
+def recent_csv_keys(path, key_columns, tail_bytes=65536):
+    """Keys of the rows in the last ``tail_bytes`` of a CSV file.
+
+    Lets an append-only CSV sink skip rows it already wrote before a crash
+    interrupted the checkpoint, without reading the whole file.
+    """
+    keys = set()
+    if not os.path.exists(path):
+        return keys
+    with open(path, "rb") as fh:
+        header = fh.readline().decode("utf-8").strip("\r\n").split(",")
+        header_end = fh.tell()
+        start = max(header_end, os.fstat(fh.fileno()).st_size - tail_bytes)
+        fh.seek(start)
+        tail = fh.read()
+    if start > header_end:
+        tail = tail[tail.find(b"\n") + 1:]
+    idx = [header.index(c) for c in key_columns if c in header]
+    if len(idx) != len(key_columns):
+        return keys
+    for row in csv.reader(io.StringIO(tail.decode("utf-8", "replace"))):
+        if len(row) > max(idx):
+            keys.add(tuple(row[i] for i in idx))
+    return keys
@@ -0,0 +1,309 @@
+"""ReportLab layouts of the sales invoice, proforma invoice and advance receipt.
+
+Importing this module loads ReportLab; go through ``invoice_core.renderer``
+so that only happens when the first PDF is rendered. Each builder writes to
+``out`` (a path or file object) or, without one, returns the PDF bytes.
+"""
+import io
+
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import (
+    SimpleDocTemplate, Paragraph, Spacer,
+    Table, KeepTogether, Frame, PageTemplate
+)
+
+from . import resources, templates
+
+
+def sales_pdf(data, logo_path, out=None, credit=True):
+    buf = io.BytesIO() if out is None else out
+    doc = SimpleDocTemplate(buf, pagesize=A4,
+                            topMargin=45, bottomMargin=35,
+                            leftMargin=40, rightMargin=40)
+    styles = resources.stylesheet()
+    elements = []
+
+    logo = resources.image(logo_path, width=90, height=40)
+    if logo:
+        logo.hAlign = "LEFT"
+        elements.append(logo)
+        elements.append(Spacer(1, 6))
+        elements.append(Paragraph("Authorized Dealer", resources.paragraph_style("smallGray")))
+
+    title = Paragraph("<b><font size=\"15\">SALES INVOICE</font></b>", styles["Title"])
+    subtitle = Paragraph(
+        f"<para align='center'><font size=\"10\">{data['dealer']}</font></para>",
+        styles["Normal"]
+    )
+
+    bill_line = Paragraph(
+        f"<para align='center'><b>Bill No: {data['invoice_no']}</b></para>",
+        styles["Normal"]
+    )
+
+    elements += [title, Spacer(1, 6), subtitle, Spacer(1, 20)]
+
+    if data.get("show_finance"):
+        fin = Paragraph(
+            f"<b>To:</b> {data['finance_company']}<br/><font size=\"9\">{data['finance_address']}</font>",
+            styles["Normal"]
+        )
+        elements += [fin, Spacer(1, 12)]
+
+    header = [
+        ["", "", "Date:", data["date"]],
+        ["", "", "Invoice No:", data["invoice_no"]],
+        ["Customer Name:", data["customer"], "", ""],
+        ["Address:", data["cust_addr"], "", ""],
+        ["NIC:", data["nic"], "", ""],
+    ]
+    t = Table(header, colWidths=[95, 250, 70, 90])
+    t.setStyle(resources.table_style("header"))
+    elements += [t, Spacer(1, 20)]
+
+    v = [
+        ["Model", data["model"]],
+        ["Engine No", data["engine"]],
+        ["Chassis No", data["chassis"]],
+        ["Color", data["color"]],
+        ["Engine Capacity", "435.6 cc"],
+        ["Manufactured Year", "2025"],
+        ["Country of Origin", "India"],
+    ]
+    vt = Table(v, colWidths=[150, 250])
+    vt.setStyle(resources.table_style("details"))
+    elements += [
+        Paragraph("<b>Vehicle Details</b>", styles["Heading4"]),
+        Spacer(1, 8),
+        vt,
+        Spacer(1, 18)
+    ]
+
+    label_price = "Vehicle Price" if not data.get("is_leasing") else "Total Price"
+    label_down = "Total Payment" if not data.get("is_leasing") else "Down Payment"
+    pay = [
+        [label_price, f"Rs. {data['price']:,.2f}"],
+        [label_down, f"Rs. {data['down']:,.2f}"],
+    ]
+    if (data.get("balance", 0.0) or 0.0) > 0.0:
+        bal_label = "Leasing Amount" if data.get("is_leasing") else "Balance"
+        pay.append([bal_label, f"Rs. {data['balance']:,.2f}"])
+    pt = Table(pay, colWidths=[200, 200])
+    pt.setStyle(resources.table_style("payment"))
+    elements += [
+        Paragraph("<b>Payment Summary</b>", styles["Heading4"]),
+        Spacer(1, 8),
+        pt,
+        Spacer(1, 18)
+    ]
+
+    if data["delivery"]:
+        elements.append(
+            Paragraph(f"<b>Delivery Address:</b><br/>{data['delivery']}", styles["Normal"])
+        )
+        elements.append(Spacer(1, 20))
+
+    elements.append(Spacer(1, 80))
+    sign = Table(
+        [
+            ["........................................", "........................................"],
+            ["Customer Signature", "Authorized Signature & Stamp"]
+        ],
+        colWidths=[240, 240],
+        hAlign="CENTER"
+    )
+    sign.setStyle(resources.table_style("signature"))
+    elements += [KeepTogether(sign)]
+    elements.append(Spacer(1, 30))
+    elements.append(Paragraph("<para align='center'><b>Thank you for your business! Come again!</b></para>", styles["Normal"]))
+
+    sales_footer = templates.footer_layer(doc.leftMargin + doc.width / 2.0, credit).on_page
+    doc.build(elements, onFirstPage=sales_footer, onLaterPages=sales_footer)
+    if out is None:
+        return buf.getvalue()
+
+
+def proforma_pdf(data, logo_path, singer_logo_path, out=None, credit=True):
+    buf = io.BytesIO() if out is None else out
+    small = resources.paragraph_style("small")
+    title_style = resources.paragraph_style("title")
+
+    header_footer = templates.proforma_layer(data.get("dealer", ""), logo_path, singer_logo_path, credit).on_page
+
+    doc = SimpleDocTemplate(buf, pagesize=A4, rightMargin=25, leftMargin=25, topMargin=40, bottomMargin=30)
+    frame = Frame(25, 90, 545, 680, id="content")
+    doc.addPageTemplates([PageTemplate(id="main", frames=frame, onPage=header_footer)])
+
+    story = []
+    story.append(Spacer(1, 40))
+    story.append(Paragraph("PROFORMA INVOICE", title_style))
+    story.append(Spacer(1, 15))
+
+    top_col_widths = [190, 120, 80, 155]
+    recipient_block = (
+        f"TO : THE MANAGER\n{data['finance_company']}\n{data['finance_address']}\n\n"+
+        f"Customer: {data['customer']}\nAddress: {data['cust_addr']}\nNIC: {data['nic']}"
+    )
+    top_data = [
+        ["Proforma Invoice No.", data["invoice_no"], "DATE:", data["date"]],
+        [
+            "MANUFACTURER: INDIA\nPIAGGIO VEHICLES PVT LTD\nPUNE, MAHARASHTRA",
+            "",
+            recipient_block,
+            ""
+        ]
+    ]
+    top_table = Table(top_data, colWidths=top_col_widths)
+    top_table.setStyle(resources.table_style("proforma_top"))
+    story.append(top_table)
+    story.append(Spacer(1, 8))
+
+    desc_table = Table([
+        ["DESCRIPTION", "", "SELLING PRICE", f"{data['price']:,.2f}"],
+        ["MAKE", "PIAGGIO", "LEASE AMOUNT", f"{data['down']:,.2f}"],
+        ["MODEL", data["model"], "", ""],
+        ["COLOUR", data["color"], "", ""],
+        ["ENGINE NO", data["engine"], "", ""],
+        ["CHASSIS NO", data["chassis"], "", ""]
+    ], colWidths=[150, 200, 100, 95])
+    desc_table.setStyle(resources.table_style("boxed"))
+    story.append(desc_table)
+    story.append(Spacer(1, 8))
+
+    info_table = Table([[
+        Paragraph("""
+BRAND NEW DIESEL THREE WHEELER<br/>
+12V Self-start, four stroke, air cooled diesel engine<br/>
+435CC 8h.p.<br/>
+Warranty : 18 months or 25,000kms whichever comes first<br/>
+Services : 3 labor-free services will be provided
+""", small),
+        Paragraph("""
+REMARKS:<br/>
+Please note that the above price offered is based on the prevailing
+rates of exchange, import duties, other Government levies and
+any variations to the above will be adjusted in the final invoice.
+""", small)
+    ]], colWidths=[270, 275])
+    info_table.setStyle(resources.table_style("info"))
+    story.append(info_table)
+    story.append(Spacer(1, 10))
+
+    story.append(Paragraph("""
+<b>VALIDITY – 07 DAYS</b><br/>
+PAYMENT TERMS: All payments should be made in favor of the finance company per instructions.<br/><br/>
+
+<b>DELIVERY – Within 14 to 30 DAYS</b><br/>
+1. Prices & Specifications subject to change without prior notice.<br/>
+2. Goods being quoted are subject to availability at time of confirmed order.<br/>
+3. Model of the vehicle must be mentioned clearly on your purchase order.<br/>
+4. Seller is not responsible for delays due to government regulations or force majeure.
+""", small))
+    story.append(Spacer(1, 90))
+    story.append(Paragraph(".......................................................<br/>Authorized Signatory", small))
+
+    doc.build(story)
+    if out is None:
+        return buf.getvalue()
+
+
+def advance_pdf(data, logo_path, out=None, credit=True):
+    buf = io.BytesIO() if out is None else out
+    doc = SimpleDocTemplate(buf, pagesize=A4,
+                            topMargin=45, bottomMargin=35,
+                            leftMargin=40, rightMargin=40)
+    styles = resources.stylesheet()
+    elements = []
+
+    logo = resources.image(logo_path, width=90, height=40)
+    if logo:
+        logo.hAlign = "LEFT"
+        elements.append(logo)
+        elements.append(Spacer(1, 6))
+        elements.append(Paragraph("Authorized Dealer", resources.paragraph_style("smallGray")))
+
+    title = Paragraph("<b><font size=\"15\">ADVANCE PAYMENT RECEIPT</font></b>", styles["Title"])
+    subtitle = Paragraph(
+        f"<para align='center'><font size=\"10\">{data['dealer']}</font></para>",
+        styles["Normal"]
+    )
+
+    bill_line = Paragraph(
+        f"<para align='center'><b>Receipt No: {data['invoice_no']}</b></para>",
+        styles["Normal"]
+    )
+
+    elements += [title, Spacer(1, 6), subtitle, Spacer(1, 20)]
+
+    header = [
+        ["", "", "Date:", data["date"]],
+        ["", "", "Receipt No:", data["invoice_no"]],
+        ["Customer Name:", data["customer"], "", ""],
+        ["Address:", data["cust_addr"], "", ""],
+        ["NIC:", data["nic"], "", ""],
+    ]
+    t = Table(header, colWidths=[95, 250, 70, 90])
+    t.setStyle(resources.table_style("header"))
+    elements += [t, Spacer(1, 20)]
+
+    v = [
+        ["Model", data["model"]],
+        ["Engine No", data["engine"]],
+        ["Chassis No", data["chassis"]],
+        ["Color", data["color"]],
+    ]
+    vt = Table(v, colWidths=[150, 250])
+    vt.setStyle(resources.table_style("details"))
+    elements += [
+        Paragraph("<b>Vehicle Details</b>", styles["Heading4"]),
+        Spacer(1, 8),
+        vt,
+        Spacer(1, 18)
+    ]
+
+    advance = data["down"]
+    balance = data["balance"]
+    payment_method = data.get("payment_method", "N/A")
+
+    pay = [
+        ["Total Vehicle Price", f"Rs. {data['price']:,.2f}"],
+        ["Advance Payment Received", f"Rs. {advance:,.2f}"],
+        ["Payment Method", payment_method],
+        ["Balance to be Paid", f"Rs. {balance:,.2f}"],
+    ]
+    pt = Table(pay, colWidths=[200, 200])
+    pt.setStyle(resources.table_style("payment"))
+    elements += [
+        Paragraph("<b>Payment Details</b>", styles["Heading4"]),
+        Spacer(1, 8),
+        pt,
+        Spacer(1, 18)
+    ]
+
+    elements.append(
+        Paragraph(
+            "<b>Remarks:</b><br/>This is an advance payment receipt for the reservation of the above vehicle. "
+            "The balance payment should be made as per the agreement.",
+            styles["Normal"]
+        )
+    )
+    elements.append(Spacer(1, 40))
+
+    elements.append(Spacer(1, 60))
+    sign = Table(
+        [
+            ["........................................", "........................................"],
+            ["Customer Signature", "Authorized Signature & Stamp"]
+        ],
+        colWidths=[240, 240],
+        hAlign="CENTER"
+    )
+    sign.setStyle(resources.table_style("signature"))
+    elements += [KeepTogether(sign)]
+    elements.append(Spacer(1, 30))
+    elements.append(Paragraph("<para align='center'><b>Thank you for your business!</b></para>", styles["Normal"]))
+
+    advance_footer = templates.footer_layer(doc.leftMargin + doc.width / 2.0, credit).on_page
+    doc.build(elements, onFirstPage=advance_footer, onLaterPages=advance_footer)
+    if out is None:
+        return buf.getvalue()
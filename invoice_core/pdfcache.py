@@ -0,0 +1,139 @@
+"""Content-addressed cache of rendered invoice PDFs.
+
+A PDF is stored under the SHA-256 of its invoice type and input data, so the
+same invoice always maps to the same file and a changed invoice never serves
+a stale one. A small SQLite index maps (invoice_type, year, invoice_no) to
+the digest and records when each file was last used; once the files exceed
+``max_bytes`` the least recently used are deleted. An evicted PDF is simply
+rendered again from the stored invoice, under the same number.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_used ON blobs (used);
+CREATE TABLE IF NOT EXISTS invoices (
+    invoice_type TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    invoice_no TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (invoice_type, year, invoice_no)
+);
+CREATE INDEX IF NOT EXISTS invoices_invoice_no ON invoices (invoice_no);
+"""
+
+
+def digest(invoice_type, data):
+    canonical = json.dumps([invoice_type, data], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class PdfCache:
+    def __init__(self, path, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        os.makedirs(path, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.path, "index.db"), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def file(self, key):
+        return os.path.join(self.path, key[:2], key + ".pdf")
+
+    def put(self, invoice_type, year, data, pdf):
+        """Store ``pdf`` for this invoice and return its digest."""
+        key = digest(invoice_type, data)
+        target = self.file(key)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(pdf)
+            os.replace(tmp, target)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO blobs (digest, size, used) VALUES (?, ?, ?) "
+                "ON CONFLICT (digest) DO UPDATE SET size = excluded.size, used = excluded.used",
+                (key, len(pdf), time.time()),
+            )
+            conn.execute(
+                "INSERT INTO invoices (invoice_type, year, invoice_no, digest) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (invoice_type, year, invoice_no) DO UPDATE SET digest = excluded.digest",
+                (invoice_type, year, str(data["invoice_no"]), key),
+            )
+        self.evict()
+        return key
+
+    def lookup(self, invoice_no, invoice_type=None, year=None):
+        """(invoice_type, year, digest) of every cached invoice with this number."""
+        sql = "SELECT invoice_type, year, digest FROM invoices WHERE invoice_no = ?"
+        args = [invoice_no]
+        if invoice_type:
+            sql += " AND invoice_type = ?"
+            args.append(invoice_type)
+        if year:
+            sql += " AND year = ?"
+            args.append(year)
+        return self._connect().execute(sql, args).fetchall()
+
+    def open(self, key):
+        """Path of the cached PDF for ``key``, marked as just used, or None."""
+        target = self.file(key)
+        if not os.path.exists(target):
+            return None
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE blobs SET used = ? WHERE digest = ?", (time.time(), key))
+        return target
+
+    def get(self, key):
+        target = self.open(key)
+        if target is None:
+            return None
+        try:
+            with open(target, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def size(self):
+        return self._connect().execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def evict(self):
+        """Delete least recently used PDFs until the cache fits ``max_bytes``."""
+        conn = self._connect()
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return 0
+        removed = 0
+        with conn:
+            for key, size in conn.execute("SELECT digest, size FROM blobs ORDER BY used").fetchall():
+                if excess <= 0:
+                    break
+                conn.execute("DELETE FROM blobs WHERE digest = ?", (key,))
+                try:
+                    os.remove(self.file(key))
+                except FileNotFoundError:
+                    pass
+                excess -= size
+                removed += 1
+        return removed
@@ -0,0 +1,170 @@
+"""On-demand profiles of single invoice renders.
+
+A render is profiled when a caller asks for it or when it falls in a sampled
+fraction of requests. ``capture`` wraps the render and saves the profile
+to a ``ProfileStore`` under a random id: ``cprofile`` mode keeps the
+cProfile stats (a .prof file for snakeviz, flameprof or pstats), and
+``sample`` mode walks the rendering thread's stack every millisecond and
+keeps collapsed stacks, the input format of flamegraph.pl and speedscope.
+Each profile also gets a small JSON summary with its slowest functions or
+hottest stacks. When no profile is requested, the cost is one ``choose``
+call per request.
+"""
+import collections
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+MODES = ("cprofile", "sample")
+TOP = 40
+_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def choose(requested, allow_requests, sample_rate, default_mode="cprofile"):
+    """Mode to profile this request in, or None.
+
+    ``requested`` is the caller's ask (e.g. an X-Profile header): "1" or a
+    mode name, honoured only if ``allow_requests``. Otherwise a
+    ``sample_rate`` fraction of requests is profiled in ``default_mode``.
+    """
+    if requested and allow_requests:
+        requested = requested.strip().lower()
+        return requested if requested in MODES else default_mode
+    if sample_rate and random.random() < sample_rate:
+        return default_mode
+    return None
+
+
+class ProfileStore:
+    def __init__(self, path, keep=200):
+        self.path = path
+        self.keep = keep
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    def file(self, profile_id, ext):
+        if not _ID.match(profile_id or ""):
+            raise KeyError(profile_id)
+        return os.path.join(self.path, f"{profile_id}.{ext}")
+
+    def save(self, profile_id, meta, profile=None, stacks=None):
+        os.makedirs(self.path, exist_ok=True)
+        if profile is not None:
+            stats = pstats.Stats(profile)
+            stats.dump_stats(self.file(profile_id, "prof"))
+            rows = []
+            for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+                rows.append({
+                    "function": func, "file": filename, "line": line, "calls": nc,
+                    "tottime_ms": round(tt * 1000, 3), "cumtime_ms": round(ct * 1000, 3),
+                })
+            rows.sort(key=lambda r: -r["cumtime_ms"])
+            meta["top"] = rows[:TOP]
+        if stacks is not None:
+            with open(self.file(profile_id, "collapsed"), "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            meta["samples"] = sum(stacks.values())
+            meta["top"] = [{"stack": s, "samples": n} for s, n in stacks.most_common(TOP)]
+        tmp = self.file(profile_id, "json") + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, default=str)
+        os.replace(tmp, self.file(profile_id, "json"))
+        self.prune()
+
+    def load(self, profile_id):
+        """The JSON summary of a profile, or None."""
+        try:
+            with open(self.file(profile_id, "json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (KeyError, OSError, ValueError):
+            return None
+
+    def prune(self):
+        """Keep only the ``keep`` most recent profiles."""
+        try:
+            names = [n for n in os.listdir(self.path) if n.endswith(".json")]
+        except OSError:
+            return
+        if len(names) <= self.keep:
+            return
+        names.sort(key=lambda n: os.path.getmtime(os.path.join(self.path, n)))
+        for name in names[:len(names) - self.keep]:
+            profile_id = name[:-len(".json")]
+            for ext in ("json", "prof", "collapsed"):
+                try:
+                    os.remove(os.path.join(self.path, f"{profile_id}.{ext}"))
+                except OSError:
+                    pass
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, thread_id, interval=0.001):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        # The interpreter only switches threads every 5 ms by default; switch
+        # as often as we sample while the profile runs.
+        switch = sys.getswitchinterval()
+        sys.setswitchinterval(self.interval)
+        try:
+            self._sample()
+        finally:
+            sys.setswitchinterval(switch)
+
+    def _sample(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+@contextmanager
+def capture(store, profile_id, mode, meta):
+    """Profile the block in ``mode`` and save it as ``profile_id``."""
+    meta = dict(meta, id=profile_id, mode=mode, created=time.time())
+    started = time.perf_counter()
+    if mode == "sample":
+        profiler = _Sampler(threading.get_ident())
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if mode == "sample":
+            profiler.stop()
+        else:
+            profiler.disable()
+        meta["wall_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        try:
+            if mode == "sample":
+                store.save(profile_id, meta, stacks=profiler.stacks)
+            else:
+                store.save(profile_id, meta, profile=profiler)
+        except Exception as e:
+            print(f"Saving profile {profile_id} failed: {e}")
@@ -0,0 +1,71 @@
+"""Invoice numbers, field clean-up and the invoices.csv log.
+
+Everything here is plain Python, so the front ends can import it at start-up
+without pulling in ReportLab.
+"""
+import csv
+import os
+import re
+from datetime import datetime
+
+from .store import FIELDS
+
+CSV_COLUMNS = ["invoice_type"] + FIELDS
+
+
+def safe_float(v):
+    try:
+        return float(v)
+    except:
+        return 0.0
+
+
+def safe_filename(s):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", s.strip())[:60]
+
+
+def counter_for(invoice_type):
+    """Number sequence an invoice type draws from: cash and leasing sales share one."""
+    invoice_type = invoice_type.upper()
+    if invoice_type in ("PROFORMA", "ADVANCE"):
+        return invoice_type
+    return "SALES"
+
+
+def format_number(n):
+    return f"{n:04d}"
+
+
+def next_invoice_number(sequence, inv_type, year=None):
+    year = year or datetime.now().year
+    return format_number(sequence.next_number(counter_for(inv_type), year))
+
+
+def csv_header(path):
+    """Column names of an existing invoices.csv, or None if there is none yet."""
+    try:
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            return next(csv.reader(f), None)
+    except FileNotFoundError:
+        return None
+
+
+def append_csv(path, records, fsync=False):
+    """Append (invoice_type, data) records to invoices.csv.
+
+    A new file gets every column. An existing file keeps its own header, so
+    logs written by older versions (without payment_method, say) stay
+    readable; fields it has no column for are left out.
+    """
+    header = csv_header(path)
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=header or CSV_COLUMNS, restval="", extrasaction="ignore")
+        if not header:
+            w.writeheader()
+        for invoice_type, data in records:
+            row = {name: data.get(name, "") for name in FIELDS}
+            row["invoice_type"] = invoice_type
+            w.writerow(row)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,72 @@
+"""Entry point for rendering invoice PDFs.
+
+ReportLab and the layouts in ``invoice_core.pdf`` are imported on the first
+render (or ``warm()``), not when a front end starts, so an API cold start
+that only lists or exports invoices never pays for them.
+
+``render_job`` and ``warm_job`` are the entry points for render worker
+processes: they only need this module to be importable, and they return
+the PDF bytes (or the worker's pid) without writing anything, so the caller
+keeps every database handle in its own process.
+"""
+import os
+
+
+class Renderer:
+    def __init__(self, logo_path, singer_logo_path, credit=True):
+        self.logo_path = logo_path
+        self.singer_logo_path = singer_logo_path
+        self.credit = credit
+
+    def render(self, invoice_type, data, out=None):
+        """Render any invoice type; SALES-CASH and SALES-LEASING use the sales layout."""
+        invoice_type = invoice_type.upper()
+        if invoice_type == "PROFORMA":
+            return self.proforma(data, out)
+        if invoice_type == "ADVANCE":
+            return self.advance(data, out)
+        return self.sales(data, out)
+
+    def sales(self, data, out=None):
+        from . import pdf
+        return pdf.sales_pdf(data, self.logo_path, out, self.credit)
+
+    def proforma(self, data, out=None):
+        from . import pdf
+        return pdf.proforma_pdf(data, self.logo_path, self.singer_logo_path, out, self.credit)
+
+    def advance(self, data, out=None):
+        from . import pdf
+        return pdf.advance_pdf(data, self.logo_path, out, self.credit)
+
+    def warm(self):
+        """Load ReportLab, build the shared styles and decode the logos ahead of the first invoice."""
+        from . import pdf, resources, templates
+        resources.stylesheet()
+        for name in ("small", "smallGray", "title"):
+            resources.paragraph_style(name)
+        for name in ("header", "details", "payment", "signature", "proforma_top", "boxed", "info"):
+            resources.table_style(name)
+        # The same cache keys the layouts use: the full-size logo on sales and
+        # advance receipts, the downsampled ones on the proforma letterhead.
+        return (
+            resources.image_reader(self.logo_path),
+            resources.image_reader(self.logo_path, fit=templates.LOGO_BOX),
+            resources.image_reader(self.singer_logo_path, fit=templates.SINGER_LOGO_BOX),
+        )
+
+
+def render_job(renderer, invoice_type, data, profile=None):
+    """Render one invoice in a worker; ``profile`` is (ProfileStore, profile_id, mode) to profile it."""
+    if not profile:
+        return renderer.render(invoice_type, data)
+    from . import profiling
+    store, profile_id, mode = profile
+    with profiling.capture(store, profile_id, mode, {"invoice_type": invoice_type, "invoice_no": data["invoice_no"]}):
+        return renderer.render(invoice_type, data)
+
+
+def warm_job(renderer):
+    """Warm a worker so its first real invoice finds ReportLab loaded."""
+    renderer.warm()
+    return os.getpid()
@@ -0,0 +1,148 @@
+"""Process-wide ReportLab resources shared by every rendered PDF.
+
+Stylesheets, paragraph/table styles and decoded logos are built on first use
+and reused for the life of the process instead of per invoice. None of them
+are mutated while rendering, so one instance can serve concurrent renders.
+"""
+import functools
+import os
+
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Flowable, TableStyle
+
+# Embed images as binary Flate streams instead of ASCII85 text. Without the
+# optional C accelerator the A85 encoder alone took most of a proforma render.
+rl_config.useA85 = 0
+
+
+@functools.lru_cache(maxsize=None)
+def stylesheet():
+    return getSampleStyleSheet()
+
+
+def _paragraph_styles():
+    styles = stylesheet()
+    return {
+        "small": ParagraphStyle("small", parent=styles["Normal"], fontSize=9, leading=11),
+        "smallGray": ParagraphStyle(
+            "smallGray",
+            fontSize=9,
+            textColor=colors.gray,
+            leftIndent=3,
+            spaceAfter=10,
+            leading=9
+        ),
+        "title": ParagraphStyle("title", alignment=1, fontSize=16, fontName="Helvetica-Bold"),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def paragraph_style(name):
+    return _paragraph_styles()[name]
+
+
+_TABLE_STYLES = {
+    "header": lambda: [
+        ("FONTNAME", (0,0), (-1,-1), "Helvetica-Bold")
+    ],
+    "details": lambda: [
+        ("BACKGROUND", (0,0), (0,-1), colors.whitesmoke),
+        ("GRID", (0,0), (-1,-1), 0.25, colors.gray),
+    ],
+    "payment": lambda: [
+        ("BACKGROUND", (0,0), (0,-1), colors.whitesmoke),
+        ("GRID", (0,0), (-1,-1), 0.25, colors.black),
+        ("FONTNAME", (0,0), (-1,-1), "Helvetica-Bold")
+    ],
+    "signature": lambda: [
+        ("ALIGN", (0,0), (-1,0), "CENTER"),
+        ("ALIGN", (0,1), (-1,1), "CENTER"),
+        ("FONTNAME", (0,1), (-1,1), "Helvetica-Bold")
+    ],
+    "proforma_top": lambda: [
+        ("SPAN", (0,1), (1,1)),
+        ("SPAN", (2,1), (3,1)),
+        ("BOX", (0,0), (-1,-1), 1, colors.black),
+        ("INNERGRID", (0,0), (-1,-1), 0.5, colors.black),
+        ("VALIGN", (0,0), (-1,-1), "TOP"),
+        ("FONTSIZE", (0,0), (-1,-1), 9),
+    ],
+    "boxed": lambda: [
+        ("BOX", (0,0), (-1,-1), 1, colors.black),
+        ("INNERGRID", (0,0), (-1,-1), 0.5, colors.black),
+        ("FONTSIZE", (0,0), (-1,-1), 9),
+        ("VALIGN", (0,0), (-1,-1), "TOP")
+    ],
+    "info": lambda: [
+        ("BOX", (0,0), (-1,-1), 1, colors.black),
+        ("INNERGRID", (0,0), (-1,-1), 0.5, colors.black),
+        ("VALIGN", (0,0), (-1,-1), "TOP"),
+    ],
+}
+
+
+@functools.lru_cache(maxsize=None)
+def table_style(name):
+    return TableStyle(_TABLE_STYLES[name]())
+
+
+PRINT_DPI = 300
+
+
+@functools.lru_cache(maxsize=None)
+def image_reader(path, fit=None):
+    """Decoded image for ``path``, or None if it is missing or unreadable.
+
+    ``fit`` is the (width, height) box in points the image is drawn into.
+    Opaque images larger than that box at PRINT_DPI are downsampled once,
+    since the extra pixels only cost compression time and file size.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        reader = ImageReader(path)
+        if fit:
+            from PIL import Image as PILImage
+            im = PILImage.open(path)
+            box = (int(fit[0] * PRINT_DPI / 72), int(fit[1] * PRINT_DPI / 72))
+            if im.mode in ("RGB", "L") and (im.width > box[0] or im.height > box[1]):
+                im.thumbnail(box, PILImage.LANCZOS)
+                reader = ImageReader(im)
+        reader.getRGBData()
+        return reader
+    except Exception:
+        return None
+
+
+class CachedImage(Flowable):
+    """Platypus image drawn from a shared ``ImageReader``."""
+
+    def __init__(self, reader, width, height, hAlign="CENTER"):
+        Flowable.__init__(self)
+        self.reader = reader
+        self.width = width
+        self.height = height
+        self.hAlign = hAlign
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def draw(self):
+        self.canv.drawImage(self.reader, 0, 0, self.width, self.height, mask="auto")
+
+
+def image(path, width, height):
+    """A ``CachedImage`` flowable for ``path``, or None if it cannot be read."""
+    reader = image_reader(path)
+    if reader is None:
+        return None
+    return CachedImage(reader, width, height)
+
+
+def clear():
+    """Drop every cached resource; the next render rebuilds them."""
+    for cached in (stylesheet, paragraph_style, table_style, image_reader):
+        cached.cache_clear()
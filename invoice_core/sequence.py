@@ -0,0 +1,219 @@
+"""Invoice number allocation.
+
+Numbers are kept per (invoice type, year). ``FileSequenceAllocator`` stores
+them in ``invoice_log.csv`` used as an append-only journal: every allocation
+appends one ``invoice_type,year,last_no`` row under an exclusive OS file lock
+and the newest row for a key wins. Each process remembers how far into the
+journal it has read, so an allocation only parses the rows other processes
+appended since its last call. The journal is compacted back to one row per
+key (the original ``invoice_log.csv`` layout) once it grows large.
+
+``LeasedSequenceAllocator`` sits in front of a shared server-side counter
+(the Supabase ``reserve_invoice_numbers`` RPC, see ``api/sql``) and can keep
+a block of reserved numbers in memory so most allocations skip the round trip.
+"""
+import abc
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+if sys.platform == "win32":
+    import msvcrt
+    fcntl = None
+else:
+    import fcntl
+    msvcrt = None
+
+HEADER = b"invoice_type,year,last_no\n"
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on ``path`` (created if missing) across processes."""
+    with open(path, "a+b") as fh:
+        if fcntl:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        else:
+            fh.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class SequenceAllocator(abc.ABC):
+    """Hands out invoice numbers per (invoice type, year)."""
+
+    @abc.abstractmethod
+    def allocate(self, inv_type, year, count=1):
+        """Reserve ``count`` consecutive numbers and return the first one."""
+
+    def next_number(self, inv_type, year):
+        return self.allocate(inv_type, year, 1)
+
+
+class FileSequenceAllocator(SequenceAllocator):
+    def __init__(self, path, compact_after=4096):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.compact_after = compact_after
+        self._mutex = threading.Lock()
+        self._last = {}
+        self._offset = 0
+        self._file_id = None
+        self._rows = 0
+
+    def allocate(self, inv_type, year, count=1):
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        key = (str(inv_type), str(year))
+        with self._mutex, file_lock(self.lock_path):
+            with open(self.path, "a+b") as fh:
+                self._catch_up(fh)
+                first = self._last.get(key, 0) + 1
+                last = first + count - 1
+                fh.write(f"{key[0]},{key[1]},{last}\n".encode("utf-8"))
+                fh.flush()
+                os.fsync(fh.fileno())
+                self._offset = fh.tell()
+                self._last[key] = last
+                self._rows += 1
+            if self._rows > self.compact_after:
+                self._compact()
+        return first
+
+    def last_number(self, inv_type, year):
+        """Return the last number issued for the key, 0 if none."""
+        with self._mutex, file_lock(self.lock_path):
+            with open(self.path, "a+b") as fh:
+                self._catch_up(fh)
+        return self._last.get((str(inv_type), str(year)), 0)
+
+    def last_numbers(self):
+        """Last number issued for every (invoice type, year) in the journal."""
+        with self._mutex, file_lock(self.lock_path):
+            with open(self.path, "a+b") as fh:
+                self._catch_up(fh)
+        return {(inv_type, int(year)): n for (inv_type, year), n in self._last.items()}
+
+    def _catch_up(self, fh):
+        st = os.fstat(fh.fileno())
+        file_id = (st.st_dev, st.st_ino)
+        if file_id != self._file_id or st.st_size < self._offset:
+            # First use, or another process compacted the journal.
+            self._last, self._offset, self._rows = {}, 0, 0
+            self._file_id = file_id
+        if st.st_size == 0:
+            fh.write(HEADER)
+            self._offset = len(HEADER)
+            return
+        fh.seek(self._offset)
+        chunk = fh.read()
+        end = chunk.rfind(b"\n") + 1
+        if end < len(chunk):
+            # A writer died mid-row; that number was never handed out.
+            fh.truncate(self._offset + end)
+        for line in chunk[:end].splitlines():
+            parts = line.decode("utf-8", "replace").split(",")
+            if len(parts) != 3 or not parts[2].strip().isdigit():
+                continue
+            self._last[(parts[0], parts[1])] = int(parts[2])
+            self._rows += 1
+        self._offset += end
+        fh.seek(0, os.SEEK_END)
+
+    def _compact(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(HEADER)
+            for (inv_type, year), last in self._last.items():
+                fh.write(f"{inv_type},{year},{last}\n".encode("utf-8"))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.path)
+        self._file_id = None
+
+
+class LeasedSequenceAllocator(SequenceAllocator):
+    """Hands out numbers from blocks reserved through ``reserve``.
+
+    ``reserve(inv_type, year, count)`` must atomically bump the shared counter
+    by ``count`` and return the new last number. With ``lease_size`` above 1
+    the unused part of a block stays in this process; numbers still leased
+    when the process exits are never issued.
+    """
+
+    def __init__(self, reserve, lease_size=1):
+        self.reserve = reserve
+        self.lease_size = max(1, int(lease_size))
+        self._mutex = threading.Lock()
+        self._blocks = {}
+
+    def allocate(self, inv_type, year, count=1):
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        key = (str(inv_type), int(year))
+        with self._mutex:
+            block = self._blocks.get(key)
+            if block and block[1] - block[0] + 1 >= count:
+                first = block[0]
+                block[0] += count
+                return first
+            if count > 1:
+                # Batches get their own contiguous reservation.
+                return self.reserve(key[0], key[1], count) - count + 1
+            last = self.reserve(key[0], key[1], self.lease_size)
+            first = last - self.lease_size + 1
+            self._blocks[key] = [first + 1, last]
+            return first
+
+
+RESERVE_SQL = """
+    insert into invoice_sequences (invoice_type, year, last_no)
+    values (?, ?, ?)
+    on conflict (invoice_type, year) do update
+        set last_no = invoice_sequences.last_no + excluded.last_no
+    returning last_no
+"""
+
+
+class SQLiteSequenceStore:
+    """Local stand-in for the Supabase ``reserve_invoice_numbers`` RPC.
+
+    Runs the same upsert-returning statement against SQLite so the leasing
+    path can be exercised without a Postgres server.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        con = self._connect()
+        try:
+            con.execute(
+                "create table if not exists invoice_sequences ("
+                "invoice_type text not null, year int not null, "
+                "last_no int not null default 0, primary key (invoice_type, year))"
+            )
+        finally:
+            con.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def reserve(self, inv_type, year, count=1):
+        con = self._connect()
+        try:
+            return con.execute(RESERVE_SQL, (inv_type, year, count)).fetchone()[0]
+        finally:
+            con.close()
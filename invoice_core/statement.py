@@ -0,0 +1,237 @@
+"""Dealer statements: every invoice of a period with subtotals per finance company.
+
+A statement can run to thousands of lines, so it is not built like the
+invoice layouts, which lay out a whole document with platypus before
+anything is written. ``stream`` lays out one page at a time and yields each
+page as soon as it is full: its compressed content stream and page object,
+followed at the end by the page tree, cross-reference table and trailer.
+Only the current page and the byte offsets of the objects already written
+stay in memory, whatever the length of the statement. The text uses the
+standard Helvetica fonts, so nothing is embedded.
+"""
+import zlib
+from datetime import datetime
+
+from .records import safe_filename
+
+# A4 landscape.
+PAGE_WIDTH, PAGE_HEIGHT = 841.89, 595.28
+LEFT, RIGHT = 30, 812
+TOP, BOTTOM = 496, 50
+LINE = 12
+NO_FINANCE = "No finance company"
+
+# (field, heading, x, width, align); right-aligned columns end at x.
+COLUMNS = [
+    ("date", "Date", LEFT, 48, "left"),
+    ("invoice_no", "No", 82, 36, "left"),
+    ("invoice_type", "Type", 122, 70, "left"),
+    ("customer", "Customer", 196, 150, "left"),
+    ("model", "Model", 350, 90, "left"),
+    ("chassis", "Chassis", 444, 90, "left"),
+    ("price", "Price", 622, 80, "right"),
+    ("down", "Down", 712, 80, "right"),
+    ("balance", "Balance", RIGHT, 90, "right"),
+]
+AMOUNTS = ("price", "down", "balance")
+
+# Objects with fixed numbers; pages and their content streams follow from 5.
+CATALOG, PAGES, FONT, FONT_BOLD = 1, 2, 3, 4
+FONTS = {"F1": "Helvetica", "F2": "Helvetica-Bold"}
+
+
+def _money(v):
+    return f"{v:,.2f}"
+
+
+def _escape(text):
+    raw = str(text).encode("cp1252", "replace")
+    return raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)").decode("latin-1")
+
+
+class _Writer:
+    """Numbers objects and remembers where each one starts in the file."""
+
+    def __init__(self):
+        self.offsets = {}
+        self.position = 0
+        self.next_id = 5
+
+    def emit(self, data):
+        self.position += len(data)
+        return data
+
+    def object(self, obj_id, body):
+        self.offsets[obj_id] = self.position
+        return self.emit(f"{obj_id} 0 obj\n".encode("latin-1") + body + b"\nendobj\n")
+
+    def reserve(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+
+class _Page:
+    def __init__(self, string_width):
+        self.ops = []
+        self.y = TOP
+        self.string_width = string_width
+
+    def text(self, x, y, value, size=8, bold=False, align="left", width=None):
+        font = "F2" if bold else "F1"
+        value = str(value)
+        # No Helvetica glyph is wider than the font size, so short text needs no measuring.
+        if width and len(value) * size > width and self.string_width(value, FONTS[font], size) > width:
+            while value and self.string_width(value + "...", FONTS[font], size) > width:
+                value = value[:-1]
+            value += "..."
+        if align == "right":
+            x -= self.string_width(value, FONTS[font], size)
+        elif align == "center":
+            x -= self.string_width(value, FONTS[font], size) / 2
+        self.ops.append(f"BT /{font} {size} Tf {x:.2f} {y:.2f} Td ({_escape(value)}) Tj ET")
+
+    def rule(self, y, width=0.5):
+        self.ops.append(f"{width} w {LEFT} {y:.2f} m {RIGHT} {y:.2f} l S")
+
+    def room(self, lines):
+        return self.y - LINE * (lines - 1) >= BOTTOM
+
+    def content(self):
+        return zlib.compress("\n".join(self.ops).encode("latin-1"))
+
+
+class _Statement:
+    def __init__(self, dealer, period, string_width, generated, footer):
+        self.dealer = dealer
+        self.footer = footer
+        self.period = period
+        self.string_width = string_width
+        self.generated = generated
+        self.writer = _Writer()
+        self.page_ids = []
+        self.page = None
+
+    def new_page(self, group=None):
+        """Yield the full page, if any, and start the next one."""
+        if self.page is not None:
+            yield from self.flush()
+        page = self.page = _Page(self.string_width)
+        number = len(self.page_ids) + 1
+        page.text(LEFT, 560, self.dealer or "All dealers", size=13, bold=True, width=600)
+        page.text(RIGHT, 560, f"Page {number}", size=9, align="right")
+        page.text(LEFT, 543, f"Statement of invoices, {self.period}", size=10)
+        page.text(RIGHT, 543, f"Generated {self.generated}", size=8, align="right")
+        for field, heading, x, width, align in COLUMNS:
+            page.text(x, 516, heading, bold=True, align=align)
+        page.rule(511)
+        page.text(PAGE_WIDTH / 2, 25, self.footer, size=7, align="center")
+        if group is not None:
+            page.text(LEFT, page.y, f"{group} (continued)", size=9, bold=True)
+            page.y -= LINE
+
+    def flush(self):
+        content_id, page_id = self.writer.reserve(), self.writer.reserve()
+        content = self.page.content()
+        yield self.writer.object(content_id, (
+            f"<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n".encode("latin-1")
+            + content + b"\nendstream"
+        ))
+        yield self.writer.object(page_id, (
+            f"<< /Type /Page /Parent {PAGES} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 {FONT} 0 R /F2 {FONT_BOLD} 0 R >> >> "
+            f"/Contents {content_id} 0 R >>"
+        ).encode("latin-1"))
+        self.page_ids.append(page_id)
+        self.page = None
+
+    def ensure(self, lines, group=None):
+        if not self.page.room(lines):
+            yield from self.new_page(group)
+
+    def row(self, row):
+        page = self.page
+        for field, heading, x, width, align in COLUMNS:
+            value = _money(row[field]) if field in AMOUNTS else row[field]
+            page.text(x, page.y, value, align=align, width=width)
+        page.y -= LINE
+
+    def total(self, label, totals, count):
+        page = self.page
+        page.rule(page.y + LINE - 3, 0.3)
+        page.text(COLUMNS[3][2], page.y, f"{label}: {count} invoice{'s' if count != 1 else ''}", bold=True, width=COLUMNS[6][2] - COLUMNS[6][3] - COLUMNS[3][2])
+        for field, heading, x, width, align in COLUMNS:
+            if field in AMOUNTS:
+                page.text(x, page.y, _money(totals[field]), bold=True, align="right")
+        page.y -= LINE * 1.5
+
+    def finish(self):
+        yield from self.flush()
+        w = self.writer
+        kids = " ".join(f"{i} 0 R" for i in self.page_ids)
+        yield w.object(PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode("latin-1"))
+        yield w.object(CATALOG, f"<< /Type /Catalog /Pages {PAGES} 0 R >>".encode("latin-1"))
+        info = w.reserve()
+        title = _escape(f"Statement {self.dealer} {self.period}")
+        yield w.object(info, f"<< /Title ({title}) /Producer (invoice_core.statement) >>".encode("latin-1"))
+        xref = w.position
+        entries = ["0000000000 65535 f "] + [f"{w.offsets[i]:010d} 00000 n " for i in range(1, w.next_id)]
+        yield w.emit((
+            f"xref\n0 {w.next_id}\n" + "\n".join(entries) + "\n"
+            f"trailer\n<< /Size {w.next_id} /Root {CATALOG} 0 R /Info {info} 0 R >>\n"
+            f"startxref\n{xref}\n%%EOF\n"
+        ).encode("latin-1"))
+
+
+def stream(rows, dealer, period, generated=None):
+    """Yield a statement PDF, one page per chunk.
+
+    ``rows`` are invoice dicts with the store's fields, ordered by finance
+    company (as ``InvoiceStore.iter_statement`` returns them); each company
+    gets a subtotal and the statement ends with a grand total.
+    """
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from .templates import CONTACT_LINE
+
+    generated = generated or datetime.now().strftime("%Y-%m-%d %H:%M")
+    doc = _Statement(dealer, period, stringWidth, generated, CONTACT_LINE)
+    w = doc.writer
+    yield w.emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    for font_id, name in ((FONT, FONTS["F1"]), (FONT_BOLD, FONTS["F2"])):
+        yield w.object(font_id, (
+            f"<< /Type /Font /Subtype /Type1 /BaseFont /{name} /Encoding /WinAnsiEncoding >>"
+        ).encode("latin-1"))
+    yield from doc.new_page()
+
+    group, count, totals = None, 0, dict.fromkeys(AMOUNTS, 0.0)
+    grand_count, grand = 0, dict.fromkeys(AMOUNTS, 0.0)
+    for row in rows:
+        name = row.get("finance_company") or NO_FINANCE
+        if name != group:
+            if group is not None:
+                yield from doc.ensure(1, group)
+                doc.total(f"Total {group}", totals, count)
+            group, count, totals = name, 0, dict.fromkeys(AMOUNTS, 0.0)
+            # Keep a heading with at least one of its rows.
+            yield from doc.ensure(2)
+            doc.page.text(LEFT, doc.page.y, group, size=9, bold=True, width=RIGHT - LEFT)
+            doc.page.y -= LINE
+        yield from doc.ensure(1, group)
+        doc.row(row)
+        count += 1
+        grand_count += 1
+        for field in AMOUNTS:
+            totals[field] += row[field] or 0
+            grand[field] += row[field] or 0
+    if group is None:
+        doc.page.text(LEFT, doc.page.y, "No invoices in this period.", size=9)
+    else:
+        yield from doc.ensure(1, group)
+        doc.total(f"Total {group}", totals, count)
+        yield from doc.ensure(1)
+        doc.total("Grand total", grand, grand_count)
+    yield from doc.finish()
+
+
+def filename(dealer, period):
+    return f"statement_{safe_filename((dealer or 'all').split(',')[0])}_{period}.pdf"
@@ -0,0 +1,290 @@
+"""Indexed local store of issued invoices.
+
+An SQLite database in WAL mode, so readers never wait for the writer and a
+lookup by invoice number, NIC, chassis or engine is an index probe instead
+of a scan of invoices.csv. Each thread gets its own connection. Rows are
+keyed on (invoice_type, year, invoice_no); writing the same invoice twice
+updates it in place, which keeps replays from the outbox idempotent.
+"""
+import base64
+import csv
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+FIELDS = [
+    "invoice_no", "date", "customer", "nic", "cust_addr", "delivery", "model",
+    "engine", "chassis", "color", "price", "down", "balance",
+    "finance_company", "finance_address", "dealer", "payment_method",
+]
+COLUMNS = ["invoice_type", "year"] + FIELDS
+NUMERIC = {"price", "down", "balance"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    invoice_type TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    invoice_no TEXT NOT NULL,
+    date TEXT NOT NULL DEFAULT '',
+    customer TEXT NOT NULL DEFAULT '',
+    nic TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    cust_addr TEXT NOT NULL DEFAULT '',
+    delivery TEXT NOT NULL DEFAULT '',
+    model TEXT NOT NULL DEFAULT '',
+    engine TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    chassis TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    color TEXT NOT NULL DEFAULT '',
+    price REAL NOT NULL DEFAULT 0,
+    down REAL NOT NULL DEFAULT 0,
+    balance REAL NOT NULL DEFAULT 0,
+    finance_company TEXT NOT NULL DEFAULT '',
+    finance_address TEXT NOT NULL DEFAULT '',
+    dealer TEXT NOT NULL DEFAULT '',
+    payment_method TEXT NOT NULL DEFAULT '',
+    UNIQUE (invoice_type, year, invoice_no)
+);
+CREATE INDEX IF NOT EXISTS invoices_invoice_no ON invoices (invoice_no);
+CREATE INDEX IF NOT EXISTS invoices_nic ON invoices (nic);
+CREATE INDEX IF NOT EXISTS invoices_chassis ON invoices (chassis);
+CREATE INDEX IF NOT EXISTS invoices_engine ON invoices (engine);
+CREATE INDEX IF NOT EXISTS invoices_date ON invoices (date);
+CREATE INDEX IF NOT EXISTS invoices_type_date ON invoices (invoice_type, date);
+CREATE INDEX IF NOT EXISTS invoices_dealer_date ON invoices (dealer, date);
+CREATE INDEX IF NOT EXISTS invoices_dealer_finance ON invoices (dealer, finance_company, date);
+CREATE INDEX IF NOT EXISTS invoices_model_date ON invoices (model, date);
+CREATE INDEX IF NOT EXISTS invoices_customer ON invoices (customer COLLATE NOCASE);
+"""
+
+UPSERT_SQL = (
+    f"INSERT INTO invoices ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+    "ON CONFLICT (invoice_type, year, invoice_no) DO UPDATE SET "
+    + ", ".join(f"{c} = excluded.{c}" for c in FIELDS[1:])
+)
+IMPORT_SQL = (
+    f"INSERT INTO invoices ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+    "ON CONFLICT (invoice_type, year, invoice_no) DO NOTHING"
+)
+
+
+def _number(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _year(data):
+    try:
+        return int(str(data.get("date", ""))[:4])
+    except ValueError:
+        return datetime.now().year
+
+
+def to_row(invoice_type, data, year=None):
+    """Column values for one invoice in ``COLUMNS`` order."""
+    row = [invoice_type, year or _year(data)]
+    for f in FIELDS:
+        v = data.get(f)
+        row.append(_number(v) if f in NUMERIC else ("" if v is None else str(v).strip()))
+    return row
+
+
+def _filters(invoice_type=None, year=None, date_from=None, date_to=None,
+             customer=None, dealer=None, model=None):
+    where, args = [], []
+    if invoice_type:
+        where.append("invoice_type = ?")
+        args.append(invoice_type)
+    if year:
+        where.append("year = ?")
+        args.append(int(year))
+    if date_from:
+        where.append("date >= ?")
+        args.append(date_from)
+    if date_to:
+        where.append("date <= ?")
+        args.append(date_to)
+    if customer:
+        where.append("customer >= ? COLLATE NOCASE AND customer < ? COLLATE NOCASE")
+        args += [customer, customer + "\U0010ffff"]
+    if dealer:
+        where.append("dealer = ?")
+        args.append(dealer)
+    if model:
+        where.append("model = ?")
+        args.append(model)
+    return where, args
+
+
+def encode_cursor(row):
+    raw = json.dumps([row["date"], row["id"]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        date, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(date), int(row_id)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+class InvoiceStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, invoice_type, data, year=None):
+        self.add_many([(invoice_type, year, data)])
+
+    def add_many(self, entries):
+        """Upsert several (invoice_type, year, data) records in one transaction."""
+        conn = self._connect()
+        with conn:
+            conn.executemany(UPSERT_SQL, (to_row(t, d, y) for t, y, d in entries))
+
+    def get(self, invoice_no, invoice_type=None, year=None):
+        """Invoices numbered ``invoice_no``, optionally narrowed by type and year."""
+        sql = "SELECT * FROM invoices WHERE invoice_no = ?"
+        args = [invoice_no]
+        if invoice_type:
+            sql += " AND invoice_type = ?"
+            args.append(invoice_type)
+        if year:
+            sql += " AND year = ?"
+            args.append(year)
+        return [dict(r) for r in self._connect().execute(sql + " ORDER BY id DESC", args)]
+
+    def find(self, field, value, limit=50):
+        """Newest invoices whose ``field`` (nic, chassis, engine, invoice_no) equals ``value``."""
+        if field not in ("nic", "chassis", "engine", "invoice_no"):
+            raise ValueError(f"Cannot look up invoices by {field}")
+        sql = f"SELECT * FROM invoices WHERE {field} = ? ORDER BY id DESC LIMIT ?"
+        return [dict(r) for r in self._connect().execute(sql, (str(value).strip(), limit))]
+
+    def chassis_invoiced(self, chassis, invoice_type=None):
+        """Most recent invoice for ``chassis`` (any type, or one type), or None."""
+        chassis = str(chassis or "").strip()
+        if not chassis:
+            return None
+        sql = "SELECT * FROM invoices WHERE chassis = ?"
+        args = [chassis]
+        if invoice_type:
+            sql += " AND invoice_type LIKE ?"
+            args.append(invoice_type + "%")
+        row = self._connect().execute(sql + " ORDER BY id DESC LIMIT 1", args).fetchone()
+        return dict(row) if row else None
+
+    def search(self, cursor=None, limit=50, **filters):
+        """One page of invoices, newest first, and the cursor of the next page.
+
+        Pages are keyed on (date, id) rather than an offset, so fetching a
+        page deep into the history costs the same as the first one.
+        Filters: invoice_type, year, date_from, date_to, customer (a
+        case-insensitive name prefix), dealer and model.
+        """
+        where, args = _filters(**filters)
+        if cursor:
+            where.append("(date, id) < (?, ?)")
+            args += list(decode_cursor(cursor))
+        sql = "SELECT * FROM invoices"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY date DESC, id DESC LIMIT ?"
+        rows = [dict(r) for r in self._connect().execute(sql, args + [limit + 1])]
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def iter_search(self, page_size=1000, **filters):
+        """Every invoice matching ``filters``, fetched one page at a time.
+
+        Each page is its own query, so the generator may be resumed from
+        another thread and never holds more than ``page_size`` rows.
+        """
+        cursor = None
+        while True:
+            rows, cursor = self.search(cursor=cursor, limit=page_size, **filters)
+            yield from rows
+            if cursor is None:
+                return
+
+    def iter_statement(self, dealer=None, date_from=None, date_to=None, invoice_type=None, page_size=1000):
+        """Invoices of a dealer statement, by finance company, then date, one page at a time.
+
+        Like ``iter_search``, each page is its own query keyed on the last row
+        of the page before, so the generator can be streamed from any thread.
+        """
+        where, args = _filters(invoice_type=invoice_type, date_from=date_from, date_to=date_to, dealer=dealer)
+        sql = "SELECT * FROM invoices"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        last = None
+        while True:
+            page_sql, page_args = sql, list(args)
+            if last:
+                page_sql += (" AND " if where else " WHERE ") + "(finance_company, date, id) > (?, ?, ?)"
+                page_args += [last["finance_company"], last["date"], last["id"]]
+            page_sql += " ORDER BY finance_company, date, id LIMIT ?"
+            rows = [dict(r) for r in self._connect().execute(page_sql, page_args + [page_size])]
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last = rows[-1]
+
+    def version(self):
+        """Highest row id; changes whenever an invoice is added by any process."""
+        return self._connect().execute("SELECT COALESCE(MAX(id), 0) FROM invoices").fetchone()[0]
+
+    def models(self):
+        return [r[0] for r in self._connect().execute("SELECT DISTINCT model FROM invoices WHERE model != '' ORDER BY model")]
+
+    def is_empty(self):
+        return self._connect().execute("SELECT 1 FROM invoices LIMIT 1").fetchone() is None
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+
+    def recent(self, limit=50):
+        return [dict(r) for r in self._connect().execute("SELECT * FROM invoices ORDER BY id DESC LIMIT ?", (limit,))]
+
+    def import_csv(self, path, chunk_size=5000):
+        """Load a legacy invoices.csv; rows already in the store are kept as is."""
+        if not os.path.exists(path):
+            return 0
+        conn = self._connect()
+        before = self.count()
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            chunk = []
+            for rec in csv.DictReader(f, restval=""):
+                if not rec.get("invoice_no"):
+                    continue
+                chunk.append(to_row(rec.get("invoice_type", ""), rec))
+                if len(chunk) >= chunk_size:
+                    with conn:
+                        conn.executemany(IMPORT_SQL, chunk)
+                    chunk = []
+            if chunk:
+                with conn:
+                    conn.executemany(IMPORT_SQL, chunk)
+        return self.count() - before
+
+    def import_csv_if_empty(self, path):
+        """First-run migration: seed an empty store from invoices.csv."""
+        if self.is_empty():
+            return self.import_csv(path)
+        return 0
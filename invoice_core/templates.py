@@ -0,0 +1,125 @@
+"""Static page decoration compiled once and drawn as a PDF Form XObject.
+
+The dealer header, logos and contact/footer lines are the same on every
+invoice for a dealer. A ``StaticLayer`` holds that decoration as a list of
+pre-computed drawing operations, built once per dealer and cached for the
+life of the process. Inside a document the first page records the layer
+into a Form XObject; every page then draws it with a single ``Do``, so
+multi-page documents carry the decoration (and its logos) only once. Logos
+are compiled at the print resolution of the box they are drawn into.
+"""
+import functools
+import hashlib
+
+from reportlab.lib import colors
+
+from . import resources
+
+CONTACT_LINE = "Contact: 0778525428 / 0768525428 | Email: gunawardhanaenttangalle@gmail.com"
+CREDIT_LINE = "Generated by UHADEV"
+# Boxes (width, height) the proforma letterhead draws its logos into.
+LOGO_BOX = (50, 50)
+SINGER_LOGO_BOX = (120, 35)
+
+
+class StaticLayer:
+    def __init__(self, key, ops):
+        self.form_name = "static" + hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+        self.ops = tuple(ops)
+
+    def draw(self, canvas):
+        if not canvas.hasForm(self.form_name):
+            canvas.beginForm(self.form_name)
+            self._replay(canvas)
+            canvas.endForm()
+        canvas.doForm(self.form_name)
+
+    def on_page(self, canvas, doc):
+        """``onPage`` callback for platypus page templates."""
+        self.draw(canvas)
+
+    def _replay(self, canvas):
+        canvas.saveState()
+        for op, *args in self.ops:
+            if op == "font":
+                canvas.setFont(*args)
+            elif op == "fill":
+                canvas.setFillColor(*args)
+            elif op == "text":
+                canvas.drawString(*args)
+            elif op == "centred":
+                canvas.drawCentredString(*args)
+            elif op == "image":
+                reader, x, y, width, height = args
+                canvas.drawImage(reader, x, y, width=width, height=height, preserveAspectRatio=True)
+        canvas.restoreState()
+
+
+def split_dealer(dealer):
+    """Split "Name, address..." into the name and the remaining address."""
+    parts = str(dealer or "").split(",")
+    return parts[0].strip() or "Dealer", ",".join(parts[1:]).strip()
+
+
+@functools.lru_cache(maxsize=64)
+def footer_layer(x, credit=True):
+    """Contact line (and credit) centred on ``x``, as on sales and advance receipts."""
+    ops = [
+        ("font", "Helvetica", 9),
+        ("fill", colors.gray),
+        ("centred", x, 25, CONTACT_LINE),
+    ]
+    if credit:
+        ops += [
+            ("font", "Helvetica", 7),
+            ("fill", colors.lightgrey),
+            ("centred", x, 15, CREDIT_LINE),
+        ]
+    return StaticLayer(("footer", x, credit), ops)
+
+
+@functools.lru_cache(maxsize=64)
+def proforma_layer(dealer, logo_path, singer_logo_path, credit=True):
+    """Dealer letterhead and footer of the proforma invoice."""
+    dealer_name, dealer_addr = split_dealer(dealer)
+    ops = []
+    logo = resources.image_reader(logo_path, fit=LOGO_BOX)
+    if logo:
+        ops.append(("image", logo, 25, 790, *LOGO_BOX))
+    ops += [
+        ("font", "Helvetica-Bold", 12),
+        ("fill", colors.HexColor("#0B3D91")),
+        ("text", 80, 820, dealer_name),
+        ("font", "Helvetica", 9),
+        ("fill", colors.grey),
+        ("text", 80, 805, "Authorized Dealer"),
+    ]
+    if dealer_addr:
+        ops += [
+            ("font", "Helvetica", 9),
+            ("fill", colors.black),
+            ("text", 80, 792, dealer_addr),
+        ]
+    singer_logo = resources.image_reader(singer_logo_path, fit=SINGER_LOGO_BOX)
+    if singer_logo:
+        ops.append(("image", singer_logo, 440, 805, *SINGER_LOGO_BOX))
+    ops += [
+        ("font", "Helvetica-Bold", 9),
+        ("centred", 300, 45, dealer_name),
+    ]
+    if dealer_addr:
+        ops += [
+            ("font", "Helvetica", 9),
+            ("centred", 300, 32, dealer_addr),
+        ]
+    ops += [
+        ("font", "Helvetica", 9),
+        ("centred", 300, 20, CONTACT_LINE),
+    ]
+    if credit:
+        ops += [
+            ("font", "Helvetica", 7),
+            ("fill", colors.lightgrey),
+            ("centred", 300, 10, CREDIT_LINE),
+        ]
+    return StaticLayer(("proforma", dealer, logo_path, singer_logo_path, credit), ops)